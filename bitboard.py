@@ -0,0 +1,404 @@
+"""Optional bitboard backend for the rules engine.
+
+BitboardGameState keeps one 64-bit integer per piece type and colour next
+to board_state and answers move generation and attack queries from
+precomputed tables. Square index is row * 8 + col, as in
+GameState.attacked_squares.
+"""
+
+from game_state import GameState, KNIGHT_OFFSETS, KING_OFFSETS, STRAIGHT_DIRECTIONS, DIAGONAL_DIRECTIONS
+
+PIECES = ['wP', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bP', 'bR', 'bN', 'bB', 'bQ', 'bK']
+
+
+def _offset_table(offsets):
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        mask = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                mask |= 1 << (r * 8 + c)
+        table.append(mask)
+    return table
+
+
+def _ray_table(directions):
+    """Per square, a list of (ray mask, rays for that direction, index increases along ray)"""
+    rays = {}
+    for dr, dc in directions:
+        masks = []
+        for square in range(64):
+            row, col = divmod(square, 8)
+            mask = 0
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                mask |= 1 << (r * 8 + c)
+                r += dr
+                c += dc
+            masks.append(mask)
+        rays[(dr, dc)] = masks
+    return [[(rays[d][square], rays[d], d[0] * 8 + d[1] > 0) for d in directions] for square in range(64)]
+
+
+KNIGHT_ATTACKS = _offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _offset_table(KING_OFFSETS)
+# Squares a pawn of each colour attacks from a square
+PAWN_ATTACKS = {'w': _offset_table([(-1, -1), (-1, 1)]), 'b': _offset_table([(1, -1), (1, 1)])}
+ROOK_RAYS = _ray_table(STRAIGHT_DIRECTIONS)
+BISHOP_RAYS = _ray_table(DIAGONAL_DIRECTIONS)
+
+
+def _slider_attacks(rays, occupied):
+    attacks = 0
+    for ray, direction_rays, increasing in rays:
+        blockers = ray & occupied
+        if blockers:
+            # The nearest blocker ends the ray; squares behind it are masked off
+            attacks |= ray ^ direction_rays[_nearest(blockers, increasing)]
+        else:
+            attacks |= ray
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    return _slider_attacks(ROOK_RAYS[square], occupied)
+
+
+def bishop_attacks(square, occupied):
+    return _slider_attacks(BISHOP_RAYS[square], occupied)
+
+
+def _nearest(blockers, increasing):
+    """Square of the blocker closest to the start of a ray"""
+    if increasing:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def squares(bitboard):
+    """Yield the square index of each set bit"""
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+class BitboardGameState(GameState):
+    def __init__(self):
+        super().__init__()
+        self.sync_bitboards()
+
+    def sync_bitboards(self):
+        """Rebuild the bitboards from board_state, after editing the board directly"""
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupied = {'w': 0, 'b': 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board_state[row][col]
+                if piece != '--':
+                    bit = 1 << (row * 8 + col)
+                    self.bitboards[piece] |= bit
+                    self.occupied[piece[0]] |= bit
+        self._attack_maps[0] = self._attack_maps[1] = None
+
+    def _board_replaced(self):
+        self.sync_bitboards()
+
+    def _move_bits(self, undo, placed):
+        """Toggle the bits changed by a move. Applying it twice restores the boards"""
+        start_row, start_col, end_row, end_col, moving_piece, captured, capture_row = undo[:7]
+        bitboards = self.bitboards
+        occupied = self.occupied
+        color = moving_piece[0]
+        from_bit = 1 << (start_row * 8 + start_col)
+        to_bit = 1 << (end_row * 8 + end_col)
+
+        bitboards[moving_piece] ^= from_bit
+        bitboards[placed] ^= to_bit
+        occupied[color] ^= from_bit | to_bit
+
+        if captured != '--':
+            capture_bit = 1 << (capture_row * 8 + end_col)
+            bitboards[captured] ^= capture_bit
+            occupied[captured[0]] ^= capture_bit
+
+        if moving_piece[1] == 'K' and abs(end_col - start_col) == 2:
+            rook_cols = (7, 5) if end_col == 6 else (0, 3)
+            rook_bits = (1 << (end_row * 8 + rook_cols[0])) | (1 << (end_row * 8 + rook_cols[1]))
+            bitboards[color + 'R'] ^= rook_bits
+            occupied[color] ^= rook_bits
+
+    def _apply_move(self, start_row, start_col, end_row, end_col, promotion=None):
+        undo = super()._apply_move(start_row, start_col, end_row, end_col, promotion)
+        self._move_bits(undo, self.board_state[end_row][end_col])
+        return undo
+
+    def _undo_move(self, undo):
+        self._move_bits(undo, self.board_state[undo[2]][undo[3]])
+        super()._undo_move(undo)
+
+    def promote(self, piece):
+        if self.awaiting_promotion:
+            row, col = self.promotion_square
+            color = 'w' if row == 0 else 'b'
+            bit = 1 << (row * 8 + col)
+            self.bitboards[color + 'P'] ^= bit
+            self.bitboards[color + piece] ^= bit
+        return super().promote(piece)
+
+    def _attackers(self, square, enemy, occupied, keep):
+        """Check if any enemy piece attacks a square. Pieces outside keep are treated as captured"""
+        bitboards = self.bitboards
+        own = 'b' if enemy == 'w' else 'w'
+        queens = bitboards[enemy + 'Q']
+        return bool(
+            KNIGHT_ATTACKS[square] & bitboards[enemy + 'N'] & keep
+            or PAWN_ATTACKS[own][square] & bitboards[enemy + 'P'] & keep
+            or KING_ATTACKS[square] & bitboards[enemy + 'K']
+            or rook_attacks(square, occupied) & (bitboards[enemy + 'R'] | queens) & keep
+            or bishop_attacks(square, occupied) & (bitboards[enemy + 'B'] | queens) & keep
+        )
+
+    def is_under_attack(self, row, col, is_white):
+        """Check if a square is under attack by opponent pieces"""
+        occupied = self.occupied['w'] | self.occupied['b']
+        return self._attackers(row * 8 + col, 'b' if is_white else 'w', occupied, -1)
+
+    def attacked_squares(self, by_white):
+        cached = self._attack_maps[by_white]
+        if cached is not None:
+            return cached
+
+        bitboards = self.bitboards
+        color = 'w' if by_white else 'b'
+        occupied = self.occupied['w'] | self.occupied['b']
+        attacks = 0
+        for square in squares(bitboards[color + 'P']):
+            attacks |= PAWN_ATTACKS[color][square]
+        for square in squares(bitboards[color + 'N']):
+            attacks |= KNIGHT_ATTACKS[square]
+        for square in squares(bitboards[color + 'K']):
+            attacks |= KING_ATTACKS[square]
+        for square in squares(bitboards[color + 'R'] | bitboards[color + 'Q']):
+            attacks |= rook_attacks(square, occupied)
+        for square in squares(bitboards[color + 'B'] | bitboards[color + 'Q']):
+            attacks |= bishop_attacks(square, occupied)
+
+        self._attack_maps[by_white] = attacks
+        return attacks
+
+    def _targets(self, square, piece, own, theirs):
+        """Mask of the squares a piece can move to, ignoring king safety and castling, and the en passant bit"""
+        start_row, start_col = divmod(square, 8)
+        piece_type = piece[1]
+        color = piece[0]
+        enemy = 'b' if color == 'w' else 'w'
+        occupied = own | theirs
+        en_passant = 0
+
+        if piece_type == 'P':
+            step = 8 if color == 'b' else -8
+            targets = PAWN_ATTACKS[color][square] & theirs
+            forward = square + step
+            if 0 <= forward < 64 and not occupied >> forward & 1:
+                targets |= 1 << forward
+                if start_row == (1 if color == 'b' else 6) and not occupied >> (forward + step) & 1:
+                    targets |= 1 << (forward + step)
+
+            # En passant capture of a pawn that just moved two squares alongside
+            if self.last_move:
+                last_start_row, last_start_col, last_end_row, last_end_col = self.last_move
+                if last_end_row == start_row and abs(last_end_col - start_col) == 1 and \
+                        self.board_state[last_end_row][last_end_col] == enemy + 'P':
+                    en_passant = 1 << (forward + last_end_col - start_col)
+                    targets |= en_passant
+        elif piece_type == 'N':
+            targets = KNIGHT_ATTACKS[square] & ~own
+        elif piece_type == 'B':
+            targets = bishop_attacks(square, occupied) & ~own
+        elif piece_type == 'R':
+            targets = rook_attacks(square, occupied) & ~own
+        elif piece_type == 'Q':
+            targets = (rook_attacks(square, occupied) | bishop_attacks(square, occupied)) & ~own
+        else:
+            targets = KING_ATTACKS[square] & ~own
+        return targets, en_passant
+
+    def get_valid_moves_for_piece(self, start_row, start_col, check_check=True):
+        """Get all valid moves for a piece"""
+        piece = self.board_state[start_row][start_col]
+        if piece == '--':
+            return []
+
+        piece_type = piece[1]
+        color = piece[0]
+        enemy = 'b' if color == 'w' else 'w'
+        own = self.occupied[color]
+        occupied = own | self.occupied[enemy]
+        square = start_row * 8 + start_col
+        targets, en_passant = self._targets(square, piece, own, self.occupied[enemy])
+
+        if not check_check:
+            return [divmod(target, 8) for target in squares(targets)]
+
+        # Keep moves that leave the king safe, testing on occupancy masks alone
+        moves = []
+        from_bit = 1 << square
+        king_bits = self.bitboards[color + 'K']
+        king_square = king_bits.bit_length() - 1
+        for target in squares(targets):
+            to_bit = 1 << target
+            if to_bit == en_passant:
+                captured_bit = 1 << (start_row * 8 + target % 8)
+            else:
+                captured_bit = to_bit
+            after = (occupied ^ from_bit ^ captured_bit) | to_bit
+            if not king_bits or not self._attackers(target if piece_type == 'K' else king_square,
+                                                   enemy, after, ~captured_bit):
+                moves.append(divmod(target, 8))
+
+        # Castling moves, already checked for king safety by can_castle
+        if piece_type == 'K':
+            if self.can_castle('k'):
+                moves.append((start_row, start_col + 2))
+            if self.can_castle('q'):
+                moves.append((start_row, start_col - 2))
+
+        return moves
+
+    def _checks_and_pins(self, king_row, king_col, color):
+        """Find what attacks the king of the given colour, as masks.
+
+        Returns the number of checkers, the mask of squares that answer a
+        single check by capture or block (all squares when not in check) and
+        a dict of pinned squares to the mask of the pin line.
+        """
+        bitboards = self.bitboards
+        enemy = 'b' if color == 'w' else 'w'
+        own = self.occupied[color]
+        occupied = own | self.occupied[enemy]
+        square = king_row * 8 + king_col
+        checkers = 0
+        block = -1
+        pins = {}
+
+        queens = bitboards[enemy + 'Q']
+        for rays, sliders in ((ROOK_RAYS[square], bitboards[enemy + 'R'] | queens),
+                              (BISHOP_RAYS[square], bitboards[enemy + 'B'] | queens)):
+            for ray, direction_rays, increasing in rays:
+                blockers = ray & occupied
+                if not blockers:
+                    continue
+                first = _nearest(blockers, increasing)
+                if sliders >> first & 1:
+                    checkers += 1
+                    block = ray ^ direction_rays[first]
+                elif own >> first & 1:
+                    # A friendly piece is pinned if the next piece behind it is an enemy slider
+                    behind = direction_rays[first] & occupied
+                    if behind:
+                        second = _nearest(behind, increasing)
+                        if sliders >> second & 1:
+                            pins[first] = ray ^ direction_rays[second]
+
+        for attackers in (KNIGHT_ATTACKS[square] & bitboards[enemy + 'N'],
+                          PAWN_ATTACKS[color][square] & bitboards[enemy + 'P']):
+            for checker in squares(attackers):
+                checkers += 1
+                block = 1 << checker
+
+        return checkers, block, pins
+
+    def _legal_moves(self):
+        """Yield legal moves for the side to move, filtering targets with the check and pin masks"""
+        bitboards = self.bitboards
+        is_white = self.white_to_move
+        color = 'w' if is_white else 'b'
+        enemy = 'b' if is_white else 'w'
+        king_bits = bitboards[color + 'K']
+        if not king_bits:
+            return
+        king_square = king_bits.bit_length() - 1
+        king_row, king_col = divmod(king_square, 8)
+        own = self.occupied[color]
+        theirs = self.occupied[enemy]
+        occupied = own | theirs
+        checkers, block, pins = self._checks_and_pins(king_row, king_col, color)
+
+        # King moves, tested with the king lifted off its square so it cannot hide behind itself
+        without_king = occupied ^ king_bits
+        for target in squares(KING_ATTACKS[king_square] & ~own):
+            to_bit = 1 << target
+            if not self._attackers(target, enemy, without_king | to_bit, ~to_bit):
+                yield (king_row, king_col) + divmod(target, 8) + (None,)
+
+        # In double check only the king can move
+        if checkers > 1:
+            return
+
+        if not checkers and king_square == (60 if is_white else 4):
+            if self.can_castle('k'):
+                yield (king_row, king_col, king_row, 6, None)
+            if self.can_castle('q'):
+                yield (king_row, king_col, king_row, 2, None)
+
+        last_rank = 0 if is_white else 7
+        for kind in 'PNBRQ':
+            piece = color + kind
+            for square in squares(bitboards[piece]):
+                targets, en_passant = self._targets(square, piece, own, theirs)
+                row, col = divmod(square, 8)
+                if en_passant and targets & en_passant:
+                    # En passant removes two pieces from a line, so probe it on the occupancy masks
+                    targets ^= en_passant
+                    captured_bit = 1 << (square - col + (en_passant.bit_length() - 1) % 8)
+                    after = (occupied ^ (1 << square) ^ captured_bit) | en_passant
+                    if not self._attackers(king_square, enemy, after, ~captured_bit):
+                        yield (row, col) + divmod(en_passant.bit_length() - 1, 8) + (None,)
+                targets &= block
+                if square in pins:
+                    targets &= pins[square]
+                for target in squares(targets):
+                    end_row, end_col = divmod(target, 8)
+                    if kind == 'P' and end_row == last_rank:
+                        for promotion in 'QRBN':
+                            yield (row, col, end_row, end_col, promotion)
+                    else:
+                        yield (row, col, end_row, end_col, None)
+
+
+def _benchmark(plies=80, games=20, seed=1):
+    """Time whole-position generation for the list and bitboard backends over random games"""
+    import random
+    import time
+
+    for cls in (GameState, BitboardGameState):
+        # Same seed and sorted moves, so both backends walk the same games
+        rng = random.Random(seed)
+        positions = 0
+        total = 0
+        elapsed = 0.0
+        for _ in range(games):
+            state = cls()
+            for _ in range(plies):
+                color = 'w' if state.white_to_move else 'b'
+                start = time.perf_counter()
+                moves = [(r, c) + move for r in range(8) for c in range(8)
+                         if state.board_state[r][c][0] == color
+                         for move in state.get_valid_moves_for_piece(r, c)]
+                elapsed += time.perf_counter() - start
+                positions += 1
+                total += len(moves)
+                if not moves or state.is_game_over():
+                    break
+                move = rng.choice(sorted(moves))
+                promotion = 'Q' if state.board_state[move[0]][move[1]][1] == 'P' and move[2] in (0, 7) else None
+                state.make_move(*move, promotion=promotion)
+        print(f"{cls.__name__:18} {positions} positions  {total} moves  "
+              f"{elapsed * 1000:.1f} ms  {positions / elapsed:.0f} positions/s")
+
+
+if __name__ == "__main__":
+    _benchmark()
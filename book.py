@@ -0,0 +1,192 @@
+"""Opening book: weighted moves keyed by Zobrist position key, in a sorted fixed-width binary file.
+
+Each entry is 16 big-endian bytes: the position key (8), the move packed
+as in the transposition table (2), a weight (2) and the number of games
+that played it (4). Entries are sorted by key, with the heaviest move of
+a position first. OpeningBook memory-maps the file and binary searches it,
+so opening a book costs nothing however big it is and processes using
+the same book share one copy in the page cache.
+
+    python book.py build games.pgn book.bin --plies 20 --min-games 3
+    python book.py probe book.bin "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+"""
+
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from game_state import GameState
+from pgn import move_san, parse_san, read_games
+from transposition import decode_move, encode_move
+
+ENTRY = struct.Struct('>QHHI')
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook:
+    """Read-only view of a book file. Use as a context manager or call close()"""
+
+    def __init__(self, path, seed=None):
+        self.path = path
+        self.rng = random.Random(seed)
+        self._file = open(path, 'rb')
+        size = self._file.seek(0, 2)
+        if size % ENTRY.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a book file: size {size} is not a multiple of {ENTRY.size}")
+        self.size = size // ENTRY.size
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def _key_at(self, index):
+        return ENTRY.unpack_from(self._map, index * ENTRY.size)[0]
+
+    def entries(self, key):
+        """(move, weight, games) for every book move of the position with this key, heaviest first"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for index in range(low, self.size):
+            entry_key, code, weight, games = ENTRY.unpack_from(self._map, index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((decode_move(code), weight, games))
+        return found
+
+    def moves(self, state):
+        """Legal book moves for a GameState as (move, weight, games).
+
+        Moves are checked against the legal moves in case of a key collision
+        or a book built with different rules.
+        """
+        found = self.entries(state.zobrist_key)
+        if not found:
+            return []
+        legal = set(state.generate_legal_moves())
+        return [entry for entry in found if entry[0] in legal]
+
+    def choose(self, state, best=False):
+        """A book move picked at random in proportion to its weight, or the heaviest with best. None when out of book"""
+        found = [entry for entry in self.moves(state) if entry[1]]
+        if not found:
+            return None
+        if best:
+            return found[0][0]
+        return self.rng.choices([move for move, _, _ in found], [weight for _, weight, _ in found])[0]
+
+
+def collect(games, max_plies=20):
+    """Count book statistics over (headers, san_moves) games.
+
+    Returns {(key, move_code): [points, games]}, where points are 2 for a
+    win, 1 for a draw and 0 for a loss from the side that played the move.
+    A game stops counting at its first illegal move.
+    """
+    stats = {}
+    for headers, san_moves in games:
+        result = headers.get('Result', '*')
+        if result not in ('1-0', '0-1', '1/2-1/2'):
+            continue
+        fen = headers.get('FEN')
+        try:
+            state = GameState.from_fen(fen) if fen else GameState()
+        except ValueError:
+            continue
+        for san in san_moves[:max_plies]:
+            try:
+                move = parse_san(state, san)
+            except ValueError:
+                break
+            if result == '1/2-1/2':
+                points = 1
+            else:
+                points = 2 if (result == '1-0') == state.white_to_move else 0
+            entry = stats.setdefault((state.zobrist_key, encode_move(move)), [0, 0])
+            entry[0] += points
+            entry[1] += 1
+            state.make_move(*move)
+    return stats
+
+
+def write_book(stats, path, min_games=1):
+    """Write collected statistics as a sorted book file. Returns the number of entries.
+
+    Moves seen in fewer than min_games games, or that never scored, are
+    left out. Weights of a position are scaled down together when its
+    heaviest move would not fit in 16 bits.
+    """
+    positions = {}
+    for (key, code), (points, games) in stats.items():
+        if games >= min_games and points:
+            positions.setdefault(key, []).append((points, code, games))
+
+    count = 0
+    with open(path, 'wb') as out:
+        for key in sorted(positions):
+            moves = sorted(positions[key], reverse=True)
+            scale = min(1.0, MAX_WEIGHT / moves[0][0])
+            for points, code, games in moves:
+                out.write(ENTRY.pack(key, code, max(1, int(points * scale)), min(games, 0xFFFFFFFF)))
+                count += 1
+    return count
+
+
+def build(pgn_path, book_path, max_plies=20, min_games=1):
+    """Build a book from the games of a PGN file. Returns the number of entries written"""
+    with open(pgn_path, encoding='utf-8', errors='replace') as lines:
+        stats = collect(read_games(lines), max_plies)
+    return write_book(stats, book_path, min_games)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or look up an opening book")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="build a book from a PGN file")
+    build_parser.add_argument('pgn')
+    build_parser.add_argument('book')
+    build_parser.add_argument('--plies', type=int, default=20, help="moves from the start of each game to use")
+    build_parser.add_argument('--min-games', type=int, default=1, help="drop moves played in fewer games")
+    probe_parser = commands.add_parser('probe', help="list the book moves of a position")
+    probe_parser.add_argument('book')
+    probe_parser.add_argument('fen', nargs='?', help="position to look up, the initial one by default")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build(args.pgn, args.book, args.plies, args.min_games)
+        print(f"Wrote {count} entries to {args.book}")
+        return 0
+
+    state = GameState.from_fen(args.fen) if args.fen else GameState()
+    with OpeningBook(args.book) as book:
+        found = book.moves(state)
+        total = sum(weight for _, weight, _ in found) or 1
+        for move, weight, games in found:
+            print(f"{move_san(state, move):8} weight {weight:6} ({weight / total:.1%})  games {games}")
+        if not found:
+            print("Position not in book")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
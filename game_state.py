@@ -0,0 +1,868 @@
+"""Headless chess rules. Holds the position and game status with no pygame dependency"""
+
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, castling_rights, compute_key, en_passant_key
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+STRAIGHT_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+DIAGONAL_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _square_steps(offsets):
+    """Per [row][col], the on-board squares one step away by each offset"""
+    return [[[(row + dr, col + dc) for dr, dc in offsets if 0 <= row + dr < 8 and 0 <= col + dc < 8]
+             for col in range(8)] for row in range(8)]
+
+
+def _square_rays(directions):
+    """Per [row][col], for each direction that leaves the square, the squares along it out to the edge in order"""
+    table = [[[] for _ in range(8)] for _ in range(8)]
+    for row in range(8):
+        for col in range(8):
+            for dr, dc in directions:
+                ray = []
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    ray.append((r, c))
+                    r += dr
+                    c += dc
+                if ray:
+                    table[row][col].append(ray)
+    return table
+
+
+# Move tables built once at import, so generation walks lists instead of checking bounds
+KNIGHT_MOVES = _square_steps(KNIGHT_OFFSETS)
+KING_MOVES = _square_steps(KING_OFFSETS)
+STRAIGHT_RAYS = _square_rays(STRAIGHT_DIRECTIONS)
+DIAGONAL_RAYS = _square_rays(DIAGONAL_DIRECTIONS)
+SLIDER_RAYS = {'R': STRAIGHT_RAYS, 'B': DIAGONAL_RAYS, 'Q': _square_rays(STRAIGHT_DIRECTIONS + DIAGONAL_DIRECTIONS)}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# FEN placement characters and the squares each stands for, and the symbol of each piece
+_FEN_SQUARES = {str(count): ['--'] * count for count in range(1, 9)}
+_FEN_SQUARES.update({kind: ['w' + kind] for kind in 'PNBRQK'})
+_FEN_SQUARES.update({kind.lower(): ['b' + kind] for kind in 'PNBRQK'})
+_FEN_SYMBOLS = {squares[0]: char for char, squares in _FEN_SQUARES.items() if not char.isdigit()}
+
+
+def square_name(row, col):
+    """Algebraic name of a square, row 0 being the 8th rank"""
+    return 'abcdefgh'[col] + str(8 - row)
+
+
+def parse_square(name):
+    """(row, col) of an algebraic square name such as 'e4'"""
+    return 8 - int(name[1]), 'abcdefgh'.index(name[0])
+
+
+def move_name(move):
+    """Coordinate notation for a move tuple, e.g. 'e2e4' or 'e7e8q'"""
+    start_row, start_col, end_row, end_col = move[:4]
+    promotion = move[4] if len(move) > 4 and move[4] else ''
+    return square_name(start_row, start_col) + square_name(end_row, end_col) + promotion.lower()
+
+
+class GameState:
+    def __init__(self):
+        self.piece_count = 32
+        self.pieces_left = {
+            'wP': 8, 'wR': 2, 'wN': 2, 'wB': 2, 'wQ': 1, 'wK': 1,
+            'bP': 8, 'bR': 2, 'bN': 2, 'bB': 2, 'bQ': 1, 'bK': 1,
+        }
+        # Track if pieces have moved (for castling)
+        self.has_moved = {
+            (0, 0): False,  # Black queenside rook
+            (0, 7): False,  # Black kingside rook
+            (0, 4): False,  # Black king
+            (7, 0): False,  # White queenside rook
+            (7, 7): False,  # White kingside rook
+            (7, 4): False,  # White king
+        }
+        self.white_to_move = True
+        self.in_check = False
+        self.checkmate = False
+        self.stalemate = False
+        self.insufficient = False
+        self.repetition = False
+        self.fifty_move = False
+        # Draw by threefold repetition and the fifty-move rule as soon as they
+        # can be claimed; when False only fivefold and seventy-five moves end the game
+        self.claim_draws = True
+        # Generate every legal move when the status is worked out after a move and keep
+        # them for legal_targets, for front ends; when False the scan stops at the first move
+        self.keep_legal_moves = False
+        # Plies since the last pawn move or capture
+        self.halfmove_clock = 0
+        # Starts at 1 and goes up after each black move, as in FEN
+        self.fullmove_number = 1
+        self.awaiting_promotion = False
+        self.promotion_square = None
+        self.last_move = None
+        # Undo records for every move played, most recent last
+        self.move_stack = []
+        # Squares attacked by each side, indexed by is_white, None until computed
+        self._attack_maps = [None, None]
+        # Legal destination squares per start square for the side to move, None until computed
+        self._legal_targets = None
+
+        # Initialize piece positions
+        self.board_state = [
+            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
+            ['bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP'],
+            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR']
+        ]
+        # Zobrist key of the position, kept up to date move by move
+        self.zobrist_key = compute_key(self)
+        # How often each position key has occurred in the game, for repetition
+        self.position_counts = {self.zobrist_key: 1}
+
+    def is_game_over(self):
+        """Check if the game has ended"""
+        return self.checkmate or self.stalemate or self.insufficient or self.repetition or self.fifty_move
+
+    def find_king(self, is_white_king):
+        """Find the position of the king"""
+        king = 'wK' if is_white_king else 'bK'
+        for row in range(8):
+            for col in range(8):
+                if self.board_state[row][col] == king:
+                    return (row, col)
+        return None
+
+    def is_under_attack(self, row, col, is_white):
+        """Check if a square is under attack by opponent pieces.
+
+        Looks outward from the square along pawn, knight, king and sliding
+        lines and stops at the first attacker found.
+        """
+        board = self.board_state
+        enemy = 'b' if is_white else 'w'
+
+        # Pawns attack diagonally forward, so look one row towards the enemy side
+        pawn_row = row - 1 if is_white else row + 1
+        if 0 <= pawn_row < 8:
+            pawn = enemy + 'P'
+            if col > 0 and board[pawn_row][col - 1] == pawn:
+                return True
+            if col < 7 and board[pawn_row][col + 1] == pawn:
+                return True
+
+        knight = enemy + 'N'
+        for r, c in KNIGHT_MOVES[row][col]:
+            if board[r][c] == knight:
+                return True
+
+        king = enemy + 'K'
+        for r, c in KING_MOVES[row][col]:
+            if board[r][c] == king:
+                return True
+
+        # Sliding pieces: the first piece met along each line decides
+        rook, bishop, queen = enemy + 'R', enemy + 'B', enemy + 'Q'
+        for rays, slider in ((STRAIGHT_RAYS, rook), (DIAGONAL_RAYS, bishop)):
+            for ray in rays[row][col]:
+                for r, c in ray:
+                    target = board[r][c]
+                    if target != '--':
+                        if target == slider or target == queen:
+                            return True
+                        break
+
+        return False
+
+    def attacked_squares(self, by_white):
+        """Bitmap of squares attacked by one side, bit row * 8 + col.
+
+        The result is cached until the next move is played or taken back.
+        """
+        cached = self._attack_maps[by_white]
+        if cached is not None:
+            return cached
+
+        board = self.board_state
+        color = 'w' if by_white else 'b'
+        attacks = 0
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece == '--' or piece[0] != color:
+                    continue
+                piece_type = piece[1]
+                if piece_type == 'P':
+                    r = row - 1 if by_white else row + 1
+                    if 0 <= r < 8:
+                        if col > 0:
+                            attacks |= 1 << (r * 8 + col - 1)
+                        if col < 7:
+                            attacks |= 1 << (r * 8 + col + 1)
+                elif piece_type == 'N' or piece_type == 'K':
+                    for r, c in (KNIGHT_MOVES if piece_type == 'N' else KING_MOVES)[row][col]:
+                        attacks |= 1 << (r * 8 + c)
+                else:
+                    for ray in SLIDER_RAYS[piece_type][row][col]:
+                        for r, c in ray:
+                            attacks |= 1 << (r * 8 + c)
+                            if board[r][c] != '--':
+                                break
+
+        self._attack_maps[by_white] = attacks
+        return attacks
+
+    def is_insufficient(self):
+        """Check if the current board state has insufficient material"""
+
+        if self.piece_count == 2: return True
+        if self.piece_count >= 4: return False
+
+        if (self.pieces_left['wP'] > 0) or (self.pieces_left['bP'] > 0): return False
+        if (self.pieces_left['wQ'] > 0) or (self.pieces_left['bQ'] > 0): return False
+        if (self.pieces_left['wR'] > 0) or (self.pieces_left['bR'] > 0): return False
+
+        return True
+
+    def can_castle(self, side):
+        """Check if castling is legal for the given side ('k' for kingside, 'q' for queenside)"""
+        row = 7 if self.white_to_move else 0
+        king_pos = (row, 4)
+
+        # Get expected rook color
+        rook_color = 'w' if self.white_to_move else 'b'
+        expected_rook = rook_color + 'R'
+
+        # King must not have moved and must be on its home square
+        if self.has_moved[king_pos] or self.board_state[row][4] != rook_color + 'K':
+            return False
+
+        if side == 'k':
+            rook_pos = (row, 7)
+            # Check if kingside rook has moved
+            if self.has_moved[rook_pos]:
+                return False
+
+            # Verify correct rook is present
+            if self.board_state[row][7] != expected_rook:
+                return False
+
+            # Check if squares between king and rook are empty
+            if self.board_state[row][5] != '--' or self.board_state[row][6] != '--':
+                return False
+
+            # King must not be in check, pass through check or land in check
+            attacked = self.attacked_squares(not self.white_to_move)
+            return not attacked & (1 << (row * 8 + 4) | 1 << (row * 8 + 5) | 1 << (row * 8 + 6))
+
+        else:  # queenside
+            rook_pos = (row, 0)
+            # Check if queenside rook has moved
+            if self.has_moved[rook_pos]:
+                return False
+
+            # Verify correct rook is present
+            if self.board_state[row][0] != expected_rook:
+                return False
+
+            # Check if squares between king and rook are empty
+            if self.board_state[row][1] != '--' or self.board_state[row][2] != '--' or self.board_state[row][3] != '--':
+                return False
+
+            # King must not be in check, pass through check or land in check
+            attacked = self.attacked_squares(not self.white_to_move)
+            return not attacked & (1 << (row * 8 + 4) | 1 << (row * 8 + 3) | 1 << (row * 8 + 2))
+
+    def _apply_move(self, start_row, start_col, end_row, end_col, promotion=None):
+        """Play a move on the board in place and return the record needed to take it back.
+
+        Only the position changes here (board, castling flags, en passant,
+        material counts and the Zobrist key, which already includes the turn
+        passing); white_to_move and game status are left to the caller.
+        """
+        board = self.board_state
+        self._attack_maps[0] = self._attack_maps[1] = None
+        self._legal_targets = None
+        moving_piece = board[start_row][start_col]
+        captured = board[end_row][end_col]
+        capture_row = end_row
+        previous_key = self.zobrist_key
+        key = previous_key ^ SIDE_KEY ^ en_passant_key(board, self.last_move)
+
+        # En passant: a pawn moving diagonally onto an empty square
+        if moving_piece[1] == 'P' and captured == '--' and start_col != end_col:
+            capture_row = start_row
+            captured = board[start_row][end_col]
+            board[start_row][end_col] = '--'
+
+        if captured != '--':
+            self.pieces_left[captured] -= 1
+            self.piece_count -= 1
+            key ^= PIECE_KEYS[captured][capture_row * 8 + end_col]
+
+        # Track piece movement for castling, a captured rook loses its rights too
+        start_moved = self.has_moved.get((start_row, start_col))
+        end_moved = self.has_moved.get((end_row, end_col))
+        if start_moved is not None or end_moved is not None:
+            key ^= CASTLING_KEYS[castling_rights(self.has_moved)]
+            if start_moved is not None:
+                self.has_moved[(start_row, start_col)] = True
+            if end_moved is not None:
+                self.has_moved[(end_row, end_col)] = True
+            key ^= CASTLING_KEYS[castling_rights(self.has_moved)]
+
+        # Castling also moves the rook
+        if moving_piece[1] == 'K' and abs(end_col - start_col) == 2:
+            rook_keys = PIECE_KEYS[moving_piece[0] + 'R']
+            if end_col == 6:
+                board[end_row][5] = board[end_row][7]
+                board[end_row][7] = '--'
+                key ^= rook_keys[end_row * 8 + 7] ^ rook_keys[end_row * 8 + 5]
+            else:
+                board[end_row][3] = board[end_row][0]
+                board[end_row][0] = '--'
+                key ^= rook_keys[end_row * 8] ^ rook_keys[end_row * 8 + 3]
+
+        board[end_row][end_col] = moving_piece
+        board[start_row][start_col] = '--'
+        placed = moving_piece
+
+        if promotion:
+            placed = moving_piece[0] + promotion
+            board[end_row][end_col] = placed
+            self.pieces_left[moving_piece] -= 1
+            self.pieces_left[placed] += 1
+
+        key ^= PIECE_KEYS[moving_piece][start_row * 8 + start_col] ^ PIECE_KEYS[placed][end_row * 8 + end_col]
+
+        undo = (start_row, start_col, end_row, end_col, moving_piece, captured, capture_row,
+                start_moved, end_moved, self.last_move, previous_key, self.halfmove_clock)
+
+        # Pawn moves and captures reset the fifty-move count
+        if moving_piece[1] == 'P' or captured != '--':
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if moving_piece[0] == 'b':
+            self.fullmove_number += 1
+
+        # Record the move for en passant tracking
+        self.last_move = (start_row, start_col, end_row, end_col) if moving_piece[1] == 'P' and abs(end_row - start_row) == 2 else None
+        if self.last_move:
+            key ^= en_passant_key(board, self.last_move)
+        self.zobrist_key = key
+        return undo
+
+    def _undo_move(self, undo):
+        """Take back a move played with _apply_move"""
+        (start_row, start_col, end_row, end_col, moving_piece, captured, capture_row,
+         start_moved, end_moved, last_move, key, halfmove_clock) = undo
+        board = self.board_state
+        self._attack_maps[0] = self._attack_maps[1] = None
+        self._legal_targets = None
+
+        # Undo a promotion, whether it was chosen in _apply_move or with promote()
+        placed = board[end_row][end_col]
+        if placed != moving_piece:
+            self.pieces_left[placed] -= 1
+            self.pieces_left[moving_piece] += 1
+
+        board[start_row][start_col] = moving_piece
+        board[end_row][end_col] = '--'
+        if captured != '--':
+            board[capture_row][end_col] = captured
+            self.pieces_left[captured] += 1
+            self.piece_count += 1
+
+        if moving_piece[1] == 'K' and abs(end_col - start_col) == 2:
+            if end_col == 6:
+                board[end_row][7] = board[end_row][5]
+                board[end_row][5] = '--'
+            else:
+                board[end_row][0] = board[end_row][3]
+                board[end_row][3] = '--'
+
+        if start_moved is not None:
+            self.has_moved[(start_row, start_col)] = start_moved
+        if end_moved is not None:
+            self.has_moved[(end_row, end_col)] = end_moved
+        self.last_move = last_move
+        self.zobrist_key = key
+        self.halfmove_clock = halfmove_clock
+        if moving_piece[0] == 'b':
+            self.fullmove_number -= 1
+
+    def make_move(self, start_row, start_col, end_row, end_col, promotion=None):
+        """Make a move and update game state.
+
+        Returns the kind of move played ('castle', 'capture' or 'move') so a
+        front end can pick a sound. If a pawn reaches the last rank without a
+        promotion piece, the turn is held until promote() is called.
+        """
+        status = (self.white_to_move, self.in_check, self.checkmate, self.stalemate, self.insufficient,
+                  self.repetition, self.fifty_move)
+        undo = self._apply_move(start_row, start_col, end_row, end_col, promotion)
+        self.move_stack.append((undo, status))
+
+        moving_piece = undo[4]
+        if moving_piece[1] == 'K' and abs(end_col - start_col) == 2:
+            kind = 'castle'
+        elif undo[5] != '--':
+            kind = 'capture'
+        else:
+            kind = 'move'
+
+        # Check for pawn promotion
+        if moving_piece[1] == 'P' and (end_row == 0 or end_row == 7) and not promotion:
+            self.awaiting_promotion = True
+            self.promotion_square = (end_row, end_col)
+            return kind
+
+        self._finish_move()
+        return kind
+
+    def unmake_move(self):
+        """Take back the last move, including a pending promotion. Returns False if there is none"""
+        if not self.move_stack:
+            return False
+
+        undo, status = self.move_stack.pop()
+        if not self.awaiting_promotion:
+            # The move was completed, so its position was counted
+            if self.position_counts[self.zobrist_key] == 1:
+                del self.position_counts[self.zobrist_key]
+            else:
+                self.position_counts[self.zobrist_key] -= 1
+        self._undo_move(undo)
+        (self.white_to_move, self.in_check, self.checkmate, self.stalemate, self.insufficient,
+         self.repetition, self.fifty_move) = status
+        self.awaiting_promotion = False
+        self.promotion_square = None
+        return True
+
+    def promote(self, piece):
+        """Complete a pending promotion with 'Q', 'R', 'B' or 'N' and pass the turn"""
+        if not self.awaiting_promotion:
+            return False
+
+        row, col = self.promotion_square
+        color = 'w' if row == 0 else 'b'
+        self.board_state[row][col] = color + piece
+        self._attack_maps[0] = self._attack_maps[1] = None
+        self._legal_targets = None
+        self.zobrist_key ^= PIECE_KEYS[color + 'P'][row * 8 + col] ^ PIECE_KEYS[color + piece][row * 8 + col]
+
+        # Update piece counts
+        self.pieces_left[color + 'P'] -= 1
+        self.pieces_left[color + piece] += 1
+
+        self.awaiting_promotion = False
+        self.promotion_square = None
+
+        self._finish_move()
+        return True
+
+    def push_move(self, start_row, start_col, end_row, end_col, promotion=None):
+        """Play a move and pass the turn without any game status work, for search and perft.
+
+        Returns the undo record to hand back to pop_move. in_check and the
+        end-of-game flags are left untouched.
+        """
+        undo = self._apply_move(start_row, start_col, end_row, end_col, promotion)
+        self.white_to_move = not self.white_to_move
+        return undo
+
+    def pop_move(self, undo):
+        """Take back a move played with push_move"""
+        self.white_to_move = not self.white_to_move
+        self._undo_move(undo)
+
+    def _finish_move(self):
+        """Switch turns and work out check, checkmate, stalemate and material draws"""
+        self.white_to_move = not self.white_to_move
+        self.position_counts[self.zobrist_key] = self.position_counts.get(self.zobrist_key, 0) + 1
+        self._update_status()
+
+    def _update_status(self):
+        """Work out check, checkmate, stalemate and the drawn endings for the side to move"""
+        # Check if the side to move is in check
+        king_pos = self.find_king(self.white_to_move)
+        self.in_check = king_pos is not None and self.is_under_attack(king_pos[0], king_pos[1], self.white_to_move)
+
+        # Check for checkmate and stalemate, keeping the full list of moves if a front end wants it
+        if self.keep_legal_moves:
+            has_valid_moves = bool(self._fill_legal_targets())
+        else:
+            has_valid_moves = self.has_any_legal_move()
+        self.checkmate = not has_valid_moves and self.in_check
+        self.stalemate = not has_valid_moves and not self.in_check
+
+        # Check for draw by insufficient material
+        self.insufficient = self.is_insufficient()
+
+        # Check for draw by repetition and the fifty/seventy-five-move rules; mate takes precedence
+        repeats = self.position_counts.get(self.zobrist_key, 0)
+        self.repetition = not self.checkmate and repeats >= (3 if self.claim_draws else 5)
+        self.fifty_move = not self.checkmate and self.halfmove_clock >= (100 if self.claim_draws else 150)
+
+    def load_fen(self, fen):
+        """Set up the position described by a FEN string.
+
+        Missing trailing fields default to white to move, no castling, no en
+        passant and move counters 0 and 1. piece_count and pieces_left are
+        derived from the placement.
+        """
+        fields = fen.split()
+        if not fields:
+            raise ValueError("Empty FEN")
+        placement = fields[0]
+        side = fields[1] if len(fields) > 1 else 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        if side not in ('w', 'b'):
+            raise ValueError(f"Bad FEN side to move: {side!r}")
+
+        board = []
+        pieces_left = {color + kind: 0 for color in 'wb' for kind in 'PRNBQK'}
+        for rank in placement.split('/'):
+            try:
+                row = [square for char in rank for square in _FEN_SQUARES[char]]
+            except KeyError as error:
+                raise ValueError(f"Bad FEN piece: {error.args[0]!r}") from None
+            if len(row) != 8:
+                raise ValueError(f"Bad FEN rank: {rank!r}")
+            board.append(row)
+            for char in rank:
+                if not char.isdigit():
+                    pieces_left[_FEN_SQUARES[char][0]] += 1
+        if len(board) != 8:
+            raise ValueError(f"Bad FEN placement: {placement!r}")
+        self.board_state = board
+        self.pieces_left = pieces_left
+        self.piece_count = sum(pieces_left.values())
+
+        # A right only counts while its king and rook are on their home squares
+        castling = ''.join(right for right, color, row, rook_col in (('K', 'w', 7, 7), ('Q', 'w', 7, 0),
+                                                                   ('k', 'b', 0, 7), ('q', 'b', 0, 0))
+                           if right in castling and board[row][4] == color + 'K'
+                           and board[row][rook_col] == color + 'R')
+
+        # Castling rights map onto the moved flags of the king and rook squares
+        self.has_moved = {
+            (0, 0): 'q' not in castling,
+            (0, 7): 'k' not in castling,
+            (0, 4): 'k' not in castling and 'q' not in castling,
+            (7, 0): 'Q' not in castling,
+            (7, 7): 'K' not in castling,
+            (7, 4): 'K' not in castling and 'Q' not in castling,
+        }
+
+        # The en passant target is behind a pawn that just moved two squares
+        self.last_move = None
+        if en_passant != '-':
+            row, col = parse_square(en_passant)
+            if row == 5:
+                self.last_move = (6, col, 4, col)
+            elif row == 2:
+                self.last_move = (1, col, 3, col)
+
+        self.white_to_move = side == 'w'
+        try:
+            self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            self.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Bad FEN move counters: {' '.join(fields[4:])!r}") from None
+        self.awaiting_promotion = False
+        self.promotion_square = None
+        self.move_stack = []
+        self._board_replaced()
+        self.zobrist_key = compute_key(self)
+        self.position_counts = {self.zobrist_key: 1}
+        self._update_status()
+
+    def to_fen(self):
+        """FEN string of the current position, the inverse of load_fen"""
+        ranks = []
+        for row in self.board_state:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += _FEN_SYMBOLS[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        rights = castling_rights(self.has_moved)
+        castling = ''.join(symbol for bit, symbol in enumerate('KQkq') if rights >> bit & 1) or '-'
+
+        # The square passed over by a pawn that just moved two squares
+        en_passant = '-'
+        if self.last_move:
+            start_row, col, end_row = self.last_move[:3]
+            en_passant = square_name((start_row + end_row) // 2, col)
+
+        return (f"{'/'.join(ranks)} {'w' if self.white_to_move else 'b'} {castling} {en_passant} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def _board_replaced(self):
+        """Drop anything derived from board_state after it has been replaced wholesale"""
+        self._attack_maps[0] = self._attack_maps[1] = None
+        self._legal_targets = None
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Create a game starting from the position described by a FEN string"""
+        state = cls()
+        state.load_fen(fen)
+        return state
+
+    def _checks_and_pins(self, king_row, king_col, color):
+        """Find what attacks the king of the given colour.
+
+        Returns the number of checkers, the squares that answer a single check
+        by capture or block (None when not in check) and a dict of pinned
+        squares to the squares along the pin line they may still move to.
+        """
+        board = self.board_state
+        enemy = 'b' if color == 'w' else 'w'
+        checkers = 0
+        block = None
+        pins = {}
+
+        queen = enemy + 'Q'
+        for rays, slider in ((STRAIGHT_RAYS, enemy + 'R'), (DIAGONAL_RAYS, enemy + 'B')):
+            for ray in rays[king_row][king_col]:
+                line = []
+                pinned = None
+                for r, c in ray:
+                    target = board[r][c]
+                    line.append((r, c))
+                    if target != '--':
+                        if target[0] == color:
+                            # A second friendly piece shields the king completely
+                            if pinned:
+                                break
+                            pinned = (r, c)
+                        else:
+                            if target == slider or target == queen:
+                                if pinned:
+                                    pins[pinned] = set(line)
+                                else:
+                                    checkers += 1
+                                    block = set(line)
+                            break
+
+        knight = enemy + 'N'
+        for r, c in KNIGHT_MOVES[king_row][king_col]:
+            if board[r][c] == knight:
+                checkers += 1
+                block = {(r, c)}
+
+        pawn_row = king_row - 1 if color == 'w' else king_row + 1
+        if 0 <= pawn_row < 8:
+            for c in (king_col - 1, king_col + 1):
+                if 0 <= c < 8 and board[pawn_row][c] == enemy + 'P':
+                    checkers += 1
+                    block = {(pawn_row, c)}
+
+        return checkers, block, pins
+
+    def _legal_moves(self):
+        """Yield legal moves for the side to move as (start_row, start_col, end_row, end_col, promotion)"""
+        board = self.board_state
+        color = 'w' if self.white_to_move else 'b'
+        is_white = self.white_to_move
+        king_pos = self.find_king(is_white)
+        if king_pos is None:
+            return
+        king_row, king_col = king_pos
+        checkers, block, pins = self._checks_and_pins(king_row, king_col, color)
+
+        # King moves are probed by playing them, so the king cannot hide behind itself
+        for r, c in KING_MOVES[king_row][king_col]:
+            target = board[r][c]
+            if target == '--' or target[0] != color:
+                undo = self._apply_move(king_row, king_col, r, c)
+                legal = not self.is_under_attack(r, c, is_white)
+                self._undo_move(undo)
+                if legal:
+                    yield (king_row, king_col, r, c, None)
+
+        # In double check only the king can move
+        if checkers > 1:
+            return
+
+        if not checkers and (king_row, king_col) == (7 if is_white else 0, 4):
+            if self.can_castle('k'):
+                yield (king_row, king_col, king_row, 6, None)
+            if self.can_castle('q'):
+                yield (king_row, king_col, king_row, 2, None)
+
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece == '--' or piece[0] != color or piece[1] == 'K':
+                    continue
+                allowed = pins.get((row, col))
+                is_pawn = piece[1] == 'P'
+                for end_row, end_col in self.get_valid_moves_for_piece(row, col, check_check=False):
+                    if is_pawn and end_col != col and board[end_row][end_col] == '--':
+                        # En passant removes two pieces from a line, so probe it in full
+                        undo = self._apply_move(row, col, end_row, end_col)
+                        legal = not self.is_under_attack(king_row, king_col, is_white)
+                        self._undo_move(undo)
+                        if not legal:
+                            continue
+                    else:
+                        if block is not None and (end_row, end_col) not in block:
+                            continue
+                        if allowed is not None and (end_row, end_col) not in allowed:
+                            continue
+
+                    if is_pawn and (end_row == 0 or end_row == 7):
+                        for promotion in 'QRBN':
+                            yield (row, col, end_row, end_col, promotion)
+                    else:
+                        yield (row, col, end_row, end_col, None)
+
+    def generate_legal_moves(self):
+        """All legal moves for the side to move as (start_row, start_col, end_row, end_col, promotion).
+
+        Checkers and pins are worked out once for the position, so only king
+        moves and en passant captures need a king safety probe.
+        """
+        return list(self._legal_moves())
+
+    def _fill_legal_targets(self):
+        """Generate the legal moves and keep their destinations by start square. Returns the moves"""
+        moves = self.generate_legal_moves()
+        targets = {}
+        for start_row, start_col, end_row, end_col, _ in moves:
+            squares = targets.setdefault((start_row, start_col), [])
+            # The four promotion moves share one destination
+            if not squares or squares[-1] != (end_row, end_col):
+                squares.append((end_row, end_col))
+        self._legal_targets = targets
+        return moves
+
+    def legal_targets(self, row, col):
+        """Legal destination squares of the piece on a square, as get_valid_moves_for_piece gives them.
+
+        Served from the moves generated once per position, by the status scan
+        after a move when keep_legal_moves is set or else on first use; any
+        move played or taken back drops them. Empty for a square without a
+        piece of the side to move.
+        """
+        if self._legal_targets is None:
+            self._fill_legal_targets()
+        return self._legal_targets.get((row, col), [])
+
+    def has_any_legal_move(self):
+        """Check if the side to move has a legal move, stopping at the first one found"""
+        for _ in self._legal_moves():
+            return True
+        return False
+
+    def get_valid_moves_for_piece(self, start_row, start_col, check_check=True):
+        """Get all valid moves for a piece"""
+        board = self.board_state
+        piece = board[start_row][start_col]
+        moves = []
+        valid_moves = []
+
+        if piece == '--':
+            return moves
+
+        piece_type = piece[1]
+        piece_color = piece[0]
+
+        # Pawn moves
+        if piece_type == 'P':
+            direction = 1 if piece_color == 'b' else -1
+
+            # Forward move
+            if 0 <= start_row + direction < 8 and self.board_state[start_row + direction][start_col] == '--':
+                moves.append((start_row + direction, start_col))
+                # Initial two-square move
+                if (piece_color == 'w' and start_row == 6) or (piece_color == 'b' and start_row == 1):
+                    if self.board_state[start_row + 2*direction][start_col] == '--':
+                        moves.append((start_row + 2*direction, start_col))
+
+            # Captures
+            for col_offset in [-1, 1]:
+                if 0 <= start_col + col_offset < 8 and 0 <= start_row + direction < 8:
+                    target_piece = self.board_state[start_row + direction][start_col + col_offset]
+                    if target_piece != '--' and target_piece[0] != piece_color:
+                        moves.append((start_row + direction, start_col + col_offset))
+
+            # En passant capture
+            if self.last_move:
+                last_start_row, last_start_col, last_end_row, last_end_col = self.last_move
+                if abs(last_end_row - last_start_row) == 2 and abs(last_end_col - start_col) == 1:
+                    if last_end_row == start_row and self.board_state[last_end_row][last_end_col] == ('wP' if piece_color == 'b' else 'bP'):
+                        # King safety is checked with the other moves below
+                        moves.append((start_row + direction, last_end_col))
+
+
+        # Rook, bishop and queen moves: along each ray up to the first piece, taking it if it is an enemy
+        elif piece_type in SLIDER_RAYS:
+            for ray in SLIDER_RAYS[piece_type][start_row][start_col]:
+                for square in ray:
+                    target_piece = board[square[0]][square[1]]
+                    if target_piece == '--':
+                        moves.append(square)
+                    else:
+                        if target_piece[0] != piece_color:
+                            moves.append(square)
+                        break
+
+        # Knight moves
+        elif piece_type == 'N':
+            for square in KNIGHT_MOVES[start_row][start_col]:
+                target_piece = board[square[0]][square[1]]
+                if target_piece == '--' or target_piece[0] != piece_color:
+                    moves.append(square)
+
+        # King moves
+        elif piece_type == 'K':
+            for square in KING_MOVES[start_row][start_col]:
+                target_piece = board[square[0]][square[1]]
+                if target_piece == '--' or target_piece[0] != piece_color:
+                    moves.append(square)
+
+            # Castling moves
+            if check_check:  # Only check castling if we're checking for check
+                # Check kingside castle
+                if self.can_castle('k'):
+                    moves.append((start_row, start_col + 2))
+                # Check queenside castle
+                if self.can_castle('q'):
+                    moves.append((start_row, start_col - 2))
+
+        # Filter moves that would leave/put the king in check
+        if check_check:
+            for move in moves:
+                # Make the move in place
+                end_row, end_col = move
+                undo = self._apply_move(start_row, start_col, end_row, end_col)
+
+                # Check if king is in check after move
+                king_pos = self.find_king(piece_color == 'w')
+                if not self.is_under_attack(king_pos[0], king_pos[1], piece_color == 'w'):
+                    valid_moves.append(move)
+
+                # Restore board
+                self._undo_move(undo)
+
+            return valid_moves
+
+        return moves
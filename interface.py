@@ -1,11 +1,23 @@
 """App to play chess. Claude 3.5 Sonnet and GPT 4o-mini was used to help with development"""
 
+import argparse
+import collections
+import time
+
 import pygame
-from copy import deepcopy
+
+from book import OpeningBook
+from game_state import GameState
+from pgn import move_san, write_pgn
+from profiler import Profiler
+from search import Searcher
+from tablebase import Tablebases, describe
+from worker import SearchHandle
 
 
 class ChessBoard:
-    def __init__(self):
+    def __init__(self, ai_color=None, think_time=2.0, fps=60, fen=None, pgn_path='games.pgn',
+                 book_path=None, tablebase_dir=None, profiler=None):
         pygame.init()
         self.SQUARE_SIZE = 80
         self.BOARD_SIZE = self.SQUARE_SIZE * 8
@@ -36,125 +48,208 @@ class ChessBoard:
         self.drag_piece = None
         self.drag_pos = None
         self.drag_start = None
-        self.piece_count = 32
-        self.pieces_left = {
-            'wP': 8, 'wR': 2, 'wN': 2, 'wB': 2, 'wQ': 1, 'wK': 1,
-            'bP': 8, 'bR': 2, 'bN': 2, 'bB': 2, 'bQ': 1, 'bK': 1,
-        }
-        # Track if pieces have moved (for castling)
-        self.has_moved = {
-            (0, 0): False,  # Black queenside rook
-            (0, 7): False,  # Black kingside rook
-            (0, 4): False,  # Black king
-            (7, 0): False,  # White queenside rook
-            (7, 7): False,  # White kingside rook
-            (7, 4): False,  # White king
-        }
-        self.white_to_move = True
-        self.in_check = False
-        self.checkmate = False
-        self.stalemate = False
-        self.insufficient = False
-        self.awaiting_promotion = False
-        self.promotion_square = None
-        self.last_move = None
-        
-        # Initialize piece positions
-        self.board_state = [
-            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
-            ['bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP'],
-            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR']
-        ]
+
+        # Computer opponent: 'w', 'b' or None for two human players
+        self.ai_color = ai_color
+        book = OpeningBook(book_path) if book_path else None
+        self.tablebase = Tablebases(tablebase_dir) if tablebase_dir else None
+        self.searcher = Searcher(time_limit=think_time, book=book, tablebase=self.tablebase)
+        self.search_handle = None  # Background search while the computer thinks
+        self.ai_paused = False
+
+        # H shows a best move for the side to move: (zobrist key it was found for, move, status text)
+        self.hint_searcher = Searcher(time_limit=0.5, tt_size_mb=4, book=book, tablebase=self.tablebase)
+        self.hint = None
+        self.hint_search = None  # (zobrist key, SearchHandle) while a hint is being looked for
+        self.tablebase_status = None  # (zobrist key, verdict) for the last position probed
+
+        # File that S appends the game to
+        self.pgn_path = pgn_path
+
+        # Rules engine holding the position and game status
+        self.state = GameState.from_fen(fen) if fen else GameState()
+        # Selection highlights come from the moves the end-of-move scan already generated
+        self.state.keep_legal_moves = True
         
         # Load piece images
         self.pieces = {}
         for piece in ['wP', 'wR', 'wN', 'wB', 'wQ', 'wK', 
                      'bP', 'bR', 'bN', 'bB', 'bQ', 'bK']:
+            # Converted to the display format once, so blits need no per-frame pixel conversion
             self.pieces[piece] = pygame.transform.scale(
                 pygame.image.load(f'images/{piece}.png'),
                 (self.SQUARE_SIZE, self.SQUARE_SIZE)
-            )
+            ).convert_alpha()
         
         self.valid_moves = []
 
-    def draw_board(self):
+        # Static render assets, built once instead of every frame
+        self.board_surface = pygame.Surface((self.BOARD_SIZE, self.BOARD_SIZE)).convert()
         for row in range(8):
             for col in range(8):
                 color = self.LIGHT if (row + col) % 2 == 0 else self.BROWN
-                pygame.draw.rect(
-                    self.screen, 
-                    color, 
-                    pygame.Rect(
-                        col * self.SQUARE_SIZE,
-                        row * self.SQUARE_SIZE,
-                        self.SQUARE_SIZE,
-                        self.SQUARE_SIZE
-                    )
-                )
-        
-        # Highlight selected piece and valid moves
-        if self.selected_piece:
-            row, col = self.selected_piece
+                pygame.draw.rect(self.board_surface, color, self.square_rect(row, col))
+        self.highlights = {}
+        for color in (self.YELLOW, self.RED):
             s = pygame.Surface((self.SQUARE_SIZE, self.SQUARE_SIZE))
             s.set_alpha(self.ALPHA)
-            s.fill(self.YELLOW)
-            self.screen.blit(s, (col * self.SQUARE_SIZE, row * self.SQUARE_SIZE))
-            
-            for move in self.valid_moves:
-                end_row, end_col = move
-                s = pygame.Surface((self.SQUARE_SIZE, self.SQUARE_SIZE))
-                s.set_alpha(self.ALPHA)
-                s.fill(self.YELLOW)
-                self.screen.blit(s, (end_col * self.SQUARE_SIZE, end_row * self.SQUARE_SIZE))
-        
-        # Highlight king in check
-        if self.in_check:
-            king_pos = self.find_king(self.white_to_move)
-            s = pygame.Surface((self.SQUARE_SIZE, self.SQUARE_SIZE))
-            s.set_alpha(self.ALPHA)
-            s.fill(self.RED)
-            self.screen.blit(s, (king_pos[1] * self.SQUARE_SIZE, king_pos[0] * self.SQUARE_SIZE))
+            s.fill(color)
+            self.highlights[color] = s
+        self.promotion_overlay = pygame.Surface((self.BOARD_SIZE, self.BOARD_SIZE))
+        self.promotion_overlay.set_alpha(128)
+        self.promotion_overlay.fill((0, 0, 0))
+        self.font = pygame.font.Font(None, 36)
+        self.status_cache = {}  # Status string -> (rendered text, position)
 
-        # Draw status bar
-        status_rect = pygame.Rect(0, self.BOARD_SIZE, self.BOARD_SIZE, 40)
-        pygame.draw.rect(self.screen, (200, 200, 200), status_rect)
-        font = pygame.font.Font(None, 36)
-        
-        # Status text
-        status = "White to move" if self.white_to_move else "Black to move"
-        if self.checkmate:
-            status = "Checkmate! " + ("Black" if self.white_to_move else "White") + " wins!"
-        elif self.stalemate:
+        # Frame rate cap (0 for uncapped) and what the last frame showed, for dirty-rect updates
+        self.clock = pygame.time.Clock()
+        self.fps = fps
+        self.full_redraw = True
+        self.last_view = None
+        self.last_status = None
+        self.last_drag_rect = None
+        self.last_promotion = False
+
+        # Enabled Profiler that also times the drawing and gets each frame's time, shown over the board
+        self.profiler = profiler
+        if profiler is not None:
+            for name in ('render', 'draw_board', 'draw_pieces'):
+                profiler.wrap(self, name)
+            profiler.add_table('computer', self.searcher.tt)
+            profiler.add_table('hint', self.hint_searcher.tt)
+            self.profile_font = pygame.font.Font(None, 22)
+            self.overlay_rect = pygame.Rect(0, 0, 330, 18)
+            self.overlay = None
+            self.overlay_time = 0
+
+    def profile_overlay(self):
+        """Frame rate and the last move's generation cost, rebuilt at most twice a second"""
+        now = time.perf_counter()
+        if self.overlay is None or now - self.overlay_time >= 0.5:
+            text = f"{self.clock.get_fps():.0f} fps"
+            if self.profiler.last_move:
+                seconds, generation, calls = self.profiler.last_move
+                text += f"   last move {seconds * 1000:.2f} ms, generation {generation * 1000:.2f} ms / {calls} calls"
+            # Opaque, so it can be drawn again over itself
+            self.overlay = pygame.Surface(self.overlay_rect.size).convert()
+            self.overlay.fill((0, 0, 0))
+            self.overlay.blit(self.profile_font.render(text, True, (255, 255, 255)), (4, 2))
+            self.overlay_time = now
+        return self.overlay
+
+    def square_highlights(self):
+        """Squares tinted yellow (selected piece and its moves) and the red square of a king in check"""
+        yellow = set(self.valid_moves)
+        if self.selected_piece:
+            yellow.add(self.selected_piece)
+        elif self.hint and self.hint[0] == self.state.zobrist_key:
+            yellow.update(((self.hint[1][0], self.hint[1][1]), (self.hint[1][2], self.hint[1][3])))
+        red = self.state.find_king(self.state.white_to_move) if self.state.in_check else None
+        return yellow, red
+
+    def status_text(self):
+        status = "White to move" if self.state.white_to_move else "Black to move"
+        if self.state.checkmate:
+            status = "Checkmate! " + ("Black" if self.state.white_to_move else "White") + " wins!"
+        elif self.state.stalemate:
             status = "Stalemate! Draw."
-        elif self.insufficient:
+        elif self.state.insufficient:
             status = "Insufficient material! Draw."
-        elif self.in_check:
+        elif self.state.repetition:
+            status = ("Threefold" if self.state.claim_draws else "Fivefold") + " repetition! Draw."
+        elif self.state.fifty_move:
+            status = ("Fifty" if self.state.claim_draws else "Seventy-five") + "-move rule! Draw."
+        elif self.state.in_check:
             status = "Check! " + status
-        elif self.awaiting_promotion:
+        elif self.state.awaiting_promotion:
             status = "Choose promotion piece: Q, R, B, or N"
-        
-        text = font.render(status, True, (0, 0, 0))
-        text_rect = text.get_rect(center=(self.BOARD_SIZE/2, self.BOARD_SIZE + 20))
-        self.screen.blit(text, text_rect)
+        elif self.search_handle:
+            progress = self.search_handle.progress
+            status = "Thinking" + (f" (depth {progress[0]})" if progress else "") + "... M: move now"
+        elif self.hint and self.hint[0] == self.state.zobrist_key:
+            status = self.hint[2]
+        elif self.hint_search and self.hint_search[0] == self.state.zobrist_key:
+            status = "Looking for a hint..."
+        elif self.tablebase is not None:
+            verdict = self.tablebase_verdict()
+            if verdict:
+                status += f" ({verdict})"
+        return status
+
+    def tablebase_verdict(self):
+        """Tablebase result of the current position, probed once per position. None when not covered"""
+        key = self.state.zobrist_key
+        if self.tablebase_status is None or self.tablebase_status[0] != key:
+            value = self.tablebase.probe(self.state)
+            self.tablebase_status = (key, None if value is None else describe(value, self.state.white_to_move))
+        return self.tablebase_status[1]
+
+    def show_hint(self):
+        """Start looking for a move for the side to move, from the tablebase or a short search"""
+        if self.state.is_game_over() or self.state.awaiting_promotion or self.is_ai_turn():
+            return
+        if self.hint_search is not None:
+            return
+        self.hint_search = (self.state.zobrist_key, SearchHandle(self.hint_searcher, self.state).start())
+
+    def update_hint(self):
+        """Highlight the hint once its search is done, if the position is still the one it was asked for"""
+        if self.hint_search is None or not self.hint_search[1].done():
+            return
+        key, handle = self.hint_search
+        self.hint_search = None
+        move = handle.result
+        if handle.aborted or move is None or key != self.state.zobrist_key:
+            return
+        text = "Hint: " + move_san(self.state, move)
+        if self.hint_searcher.from_tablebase:
+            text += f" ({describe(self.tablebase.probe(self.state), self.state.white_to_move)})"
+        self.hint = (key, move, text)
+
+    def stop_hint(self):
+        """Abort any hint search, discarding its move"""
+        if self.hint_search is not None:
+            self.hint_search[1].abort()
+            self.hint_search[1].wait()
+            self.hint_search = None
+
+    def draw_board(self):
+        self.screen.blit(self.board_surface, (0, 0))
+
+        # Highlight selected piece and valid moves, then king in check
+        yellow, red = self.square_highlights()
+        for row, col in yellow:
+            self.draw_highlight(row, col, self.YELLOW)
+        if red:
+            self.draw_highlight(red[0], red[1], self.RED)
+
+        self.draw_status(self.status_text())
+
+    def draw_highlight(self, row, col, color):
+        self.screen.blit(self.highlights[color], (col * self.SQUARE_SIZE, row * self.SQUARE_SIZE))
+
+    def draw_status(self, status):
+        status_rect = pygame.Rect(0, self.BOARD_SIZE, self.BOARD_SIZE, 40)
+        pygame.draw.rect(self.screen, (200, 200, 200), status_rect)
+        cached = self.status_cache.get(status)
+        if cached is None:
+            # Only a few dozen distinct strings occur, mostly the thinking depths
+            if len(self.status_cache) > 100:
+                self.status_cache.clear()
+            text = self.font.render(status, True, (0, 0, 0))
+            cached = self.status_cache[status] = (text, text.get_rect(center=(self.BOARD_SIZE/2, self.BOARD_SIZE + 20)))
+        self.screen.blit(*cached)
 
     def draw_promotion_options(self):
-        if not self.awaiting_promotion or not self.promotion_square:
+        if not self.state.awaiting_promotion or not self.state.promotion_square:
             return
             
-        row, col = self.promotion_square
+        row, col = self.state.promotion_square
         color = 'w' if row == 0 else 'b'
         pieces = ['Q', 'R', 'B', 'N']
         
         # Draw semi-transparent overlay
-        overlay = pygame.Surface((self.BOARD_SIZE, self.BOARD_SIZE))
-        overlay.set_alpha(128)
-        overlay.fill((0, 0, 0))
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.promotion_overlay, (0, 0))
         
         # Draw promotion options
         option_size = self.SQUARE_SIZE
@@ -173,7 +268,7 @@ class ChessBoard:
             self.screen.blit(piece_img, (start_x + i * option_size, start_y))
 
     def handle_promotion_click(self, pos):
-        if not self.awaiting_promotion:
+        if not self.state.awaiting_promotion:
             return False
             
         option_size = self.SQUARE_SIZE
@@ -185,54 +280,15 @@ class ChessBoard:
         if start_y <= pos[1] <= start_y + option_size:
             for i, piece in enumerate(pieces):
                 if start_x + i * option_size <= pos[0] <= start_x + (i + 1) * option_size:
-                    row, col = self.promotion_square
-                    color = 'w' if row == 0 else 'b'
-                    self.board_state[row][col] = color + piece
-                    
-                    # Update piece counts
-                    self.pieces_left[color + 'P'] -= 1
-                    self.pieces_left[color + piece] += 1
-                    
-                    self.awaiting_promotion = False
-                    self.promotion_square = None
-                    
-                    # Check if the move puts the opponent in check
-                    king_pos = self.find_king(not (color == 'w'))
-                    self.in_check = self.is_under_attack(king_pos[0], king_pos[1], not (color == 'w'))
-                    
-                    # Check for checkmate and stalemate
-                    has_valid_moves = False
-                    for r in range(8):
-                        for c in range(8):
-                            piece = self.board_state[r][c]
-                            if piece != '--' and piece[0] == ('w' if not (color == 'w') else 'b'):
-                                moves = self.get_valid_moves_for_piece(r, c)
-                                if moves:
-                                    has_valid_moves = True
-                                    break
-                        if has_valid_moves:
-                            break
-                    
-                    if not has_valid_moves:
-                        self.checkmate = self.in_check
-                        self.stalemate = not self.in_check
-                        self.checkmate_sound.play()
-                    
-                    elif self.in_check:
-                        self.check_sound.play()
-
-                    # Check for draw by insufficient material
-                    if self.is_insufficient():
-                        self.insufficient = True
-                        self.checkmate_sound.play()
-                    
+                    self.state.promote(piece)
+                    self.play_status_sound()
                     return True
         return False
 
     def draw_pieces(self):
         for row in range(8):
             for col in range(8):
-                piece = self.board_state[row][col]
+                piece = self.state.board_state[row][col]
                 if piece != '--':
                     # Don't draw the piece being dragged in its original position
                     if not (self.dragging and (row, col) == self.drag_start):
@@ -253,15 +309,99 @@ class ChessBoard:
             piece_rect = piece_img.get_rect(center=self.drag_pos)
             self.screen.blit(piece_img, piece_rect)
 
+    def drag_rect(self):
+        """Screen area covered by the dragged piece, or None"""
+        if self.dragging and self.drag_piece and self.drag_pos:
+            return self.pieces[self.drag_piece].get_rect(center=self.drag_pos)
+        return None
+
+    def square_rect(self, row, col):
+        return pygame.Rect(col * self.SQUARE_SIZE, row * self.SQUARE_SIZE, self.SQUARE_SIZE, self.SQUARE_SIZE)
+
+    def draw_square(self, row, col, piece, yellow, red):
+        """Redraw one square with its highlight and piece"""
+        rect = self.square_rect(row, col)
+        self.screen.blit(self.board_surface, rect, rect)
+        if yellow:
+            self.draw_highlight(row, col, self.YELLOW)
+        if red:
+            self.draw_highlight(row, col, self.RED)
+        if piece != '--':
+            self.screen.blit(self.pieces[piece], (col * self.SQUARE_SIZE, row * self.SQUARE_SIZE))
+
+    def render(self):
+        """Draw what changed since the last frame. Returns the screen areas to update, empty when idle"""
+        yellow, red = self.square_highlights()
+        board = self.state.board_state
+        # What each square shows: piece (hidden while dragged away), yellow and red highlight
+        view = [(board[row][col] if not (self.dragging and (row, col) == self.drag_start) else '--',
+                 (row, col) in yellow, (row, col) == red)
+                for row in range(8) for col in range(8)]
+        status = self.status_text()
+        drag_rect = self.drag_rect()
+        promotion = bool(self.state.awaiting_promotion)
+        status_rect = pygame.Rect(0, self.BOARD_SIZE, self.BOARD_SIZE, 40)
+
+        if self.full_redraw or promotion != self.last_promotion:
+            self.draw_board()
+            self.draw_pieces()
+            if promotion:
+                self.draw_promotion_options()
+            dirty = [self.screen.get_rect()]
+        elif promotion:
+            # The overlay covers the board and nothing under it can change until a piece is picked
+            dirty = []
+        else:
+            changed = {square for square in range(64) if view[square] != self.last_view[square]}
+            status_dirty = status != self.last_status
+            if drag_rect != self.last_drag_rect:
+                # Squares the dragged piece left or entered
+                for rect in (self.last_drag_rect, drag_rect):
+                    if rect:
+                        changed.update(square for square in range(64)
+                                       if rect.colliderect(self.square_rect(*divmod(square, 8))))
+                        status_dirty = status_dirty or rect.colliderect(status_rect)
+
+            dirty = []
+            for square in sorted(changed):
+                row, col = divmod(square, 8)
+                self.draw_square(row, col, *view[square])
+                dirty.append(self.square_rect(row, col))
+            if status_dirty:
+                self.draw_status(status)
+                dirty.append(status_rect)
+
+            # The dragged piece stays on top, redrawn only inside the areas just repainted
+            if drag_rect:
+                for rect in dirty:
+                    if rect.colliderect(drag_rect):
+                        self.screen.set_clip(rect)
+                        self.screen.blit(self.pieces[self.drag_piece], drag_rect)
+                self.screen.set_clip(None)
+
+        # Profiling overlay on top of everything, redrawn when it changes or something under it was
+        if self.profiler is not None:
+            overlay = self.overlay
+            if self.profile_overlay() is not overlay or any(rect.colliderect(self.overlay_rect) for rect in dirty):
+                self.screen.blit(self.overlay, self.overlay_rect)
+                dirty.append(self.overlay_rect)
+
+        self.full_redraw = False
+        self.last_view = view
+        self.last_status = status
+        self.last_drag_rect = drag_rect
+        self.last_promotion = promotion
+        return dirty
+
     def start_drag(self, row, col):
-        piece = self.board_state[row][col]
-        if piece != '--' and ((piece[0] == 'w' and self.white_to_move) or 
-                            (piece[0] == 'b' and not self.white_to_move)):
+        piece = self.state.board_state[row][col]
+        if piece != '--' and ((piece[0] == 'w' and self.state.white_to_move) or 
+                            (piece[0] == 'b' and not self.state.white_to_move)):
             self.dragging = True
             self.drag_piece = piece
             self.drag_start = (row, col)
             self.selected_piece = (row, col)
-            self.valid_moves = self.get_valid_moves_for_piece(row, col)
+            self.valid_moves = self.state.legal_targets(row, col)
             return True
         return False
 
@@ -291,394 +431,69 @@ class ChessBoard:
         self.selected_piece = None
         self.valid_moves = []
 
-    def find_king(self, is_white_king):
-        """Find the position of the king"""
-        king = 'wK' if is_white_king else 'bK'
-        for row in range(8):
-            for col in range(8):
-                if self.board_state[row][col] == king:
-                    return (row, col)
-        return None
-
-    def is_under_attack(self, row, col, is_white):
-        """Check if a square is under attack by opponent pieces"""
-        opponent_moves = []
-        for r in range(8):
-            for c in range(8):
-                piece = self.board_state[r][c]
-                if piece != '--' and (piece[0] == 'b' if is_white else piece[0] == 'w'):
-                    opponent_moves.extend(self.get_valid_moves_for_piece(r, c, check_check=False))
-        return (row, col) in opponent_moves
-
-    def is_insufficient(self):
-        """Check if the current board state has insufficient material"""
-        
-        if self.piece_count == 2: return True
-        if self.piece_count >= 4: return False
-        
-        if (self.pieces_left['wP'] > 0) or (self.pieces_left['bP'] > 0): return False
-        if (self.pieces_left['wQ'] > 0) or (self.pieces_left['bQ'] > 0): return False
-        if (self.pieces_left['wR'] > 0) or (self.pieces_left['bR'] > 0): return False
-
-        return True
+    def play_status_sound(self):
+        """Play the sound for the position reached after a completed move"""
+        if self.state.checkmate or self.state.stalemate:
+            self.checkmate_sound.play()
+        elif self.state.in_check:
+            self.check_sound.play()
 
-    def can_castle(self, side):
-        """Check if castling is legal for the given side ('k' for kingside, 'q' for queenside)"""
-        row = 7 if self.white_to_move else 0
-        king_pos = (row, 4)
-        
-        # King must not have moved
-        if self.has_moved[king_pos]:
-            return False
-        
-        # King must not be in check
-        if self.in_check:
-            return False
-        
-        # Get expected rook color
-        rook_color = 'w' if self.white_to_move else 'b'
-        expected_rook = rook_color + 'R'
-        
-        if side == 'k':
-            rook_pos = (row, 7)
-            # Check if kingside rook has moved
-            if self.has_moved[rook_pos]:
-                return False
-                
-            # Verify correct rook is present
-            if self.board_state[row][7] != expected_rook:
-                return False
-            
-            # Check if squares between king and rook are empty
-            if self.board_state[row][5] != '--' or self.board_state[row][6] != '--':
-                return False
-            
-            # Check if king passes through check
-            temp_board = deepcopy(self.board_state)
-            # Check square king passes through
-            self.board_state[row][5] = self.board_state[row][4]
-            self.board_state[row][4] = '--'
-            passing_safe = not self.is_under_attack(row, 5, self.white_to_move)
-            self.board_state = temp_board
-            
-            # Check destination square
-            temp_board = deepcopy(self.board_state)
-            self.board_state[row][6] = self.board_state[row][4]
-            self.board_state[row][4] = '--'
-            destination_safe = not self.is_under_attack(row, 6, self.white_to_move)
-            self.board_state = temp_board
-            
-            return passing_safe and destination_safe
-            
-        else:  # queenside
-            rook_pos = (row, 0)
-            # Check if queenside rook has moved
-            if self.has_moved[rook_pos]:
-                return False
-                
-            # Verify correct rook is present
-            if self.board_state[row][0] != expected_rook:
-                return False
-            
-            # Check if squares between king and rook are empty
-            if self.board_state[row][1] != '--' or self.board_state[row][2] != '--' or self.board_state[row][3] != '--':
-                return False
-            
-            # Check if king passes through check
-            temp_board = deepcopy(self.board_state)
-            # Check square king passes through
-            self.board_state[row][3] = self.board_state[row][4]
-            self.board_state[row][4] = '--'
-            passing_safe = not self.is_under_attack(row, 3, self.white_to_move)
-            self.board_state = temp_board
-            
-            # Check destination square
-            temp_board = deepcopy(self.board_state)
-            self.board_state[row][2] = self.board_state[row][4]
-            self.board_state[row][4] = '--'
-            destination_safe = not self.is_under_attack(row, 2, self.white_to_move)
-            self.board_state = temp_board
-            
-            return passing_safe and destination_safe
-    
-    def make_move(self, start_row, start_col, end_row, end_col):
-        """Make a move and update game state"""
-        moving_piece = self.board_state[start_row][start_col]
+        if self.state.insufficient or self.state.repetition or self.state.fifty_move:
+            self.checkmate_sound.play()
 
-        en_passant = False
-        
-        # En passant capture
-        if moving_piece[1] == 'P' and self.last_move:
-            last_start_row, last_start_col, last_end_row, last_end_col = self.last_move
-            if abs(end_col - start_col) == 1 and end_row == last_end_row + (1 if moving_piece[0] == 'b' else -1):
-                if self.board_state[end_row][end_col] == '--' and self.board_state[last_end_row][last_end_col] == ('wP' if moving_piece[0] == 'b' else 'bP'):
-                    # Remove the captured pawn
-                    self.board_state[last_end_row][last_end_col] = '--'
-                    self.pieces_left['wP' if moving_piece[0] == 'b' else 'bP'] -= 1
-                    self.piece_count -= 1
-                    en_passant = True
-
-        # Track piece movement for castling
-        if (start_row, start_col) in self.has_moved:
-            self.has_moved[(start_row, start_col)] = True
-        
-        # Check if the move is a castle
-        if moving_piece[1] == 'K' and abs(end_col - start_col) == 2:
-            # Kingside castle
-            if end_col == 6:
-                # Move rook
-                self.board_state[end_row][5] = self.board_state[end_row][7]
-                self.board_state[end_row][7] = '--'
-            # Queenside castle
-            else:
-                # Move rook
-                self.board_state[end_row][3] = self.board_state[end_row][0]
-                self.board_state[end_row][0] = '--'
-            
-            # Move king
-            self.board_state[end_row][end_col] = moving_piece
-            self.board_state[start_row][start_col] = '--'
+    def make_move(self, start_row, start_col, end_row, end_col, promotion=None):
+        """Make a move on the rules engine and play the matching sounds"""
+        kind = self.state.make_move(start_row, start_col, end_row, end_col, promotion)
+        if kind == 'castle':
             self.castling_sound.play()
-        
+        elif kind == 'capture':
+            self.capture_sound.play()
         else:
-            # Check if the move is a capture
-            destination = self.board_state[end_row][end_col]
-            if destination != '--':
-                self.pieces_left[destination] -= 1
-                self.piece_count -= 1
-                self.capture_sound.play()
-            elif en_passant:
-                self.capture_sound.play()
-            else:
-                self.move_sound.play()
-            
-            # Make the move
-            self.board_state[end_row][end_col] = moving_piece
-            self.board_state[start_row][start_col] = '--'
-        
-        # Record the move for en passant tracking
-        self.last_move = (start_row, start_col, end_row, end_col) if moving_piece[1] == 'P' and abs(end_row - start_row) == 2 else None
-        
-        # Check for pawn promotion
-        if moving_piece[1] == 'P' and (end_row == 0 or end_row == 7):
-            self.awaiting_promotion = True
-            self.promotion_square = (end_row, end_col)
-            return
-        
-        # Switch turns
-        self.white_to_move = not self.white_to_move
-        
-        # Check if the move puts the opponent in check
-        king_pos = self.find_king(self.white_to_move)
-        self.in_check = self.is_under_attack(king_pos[0], king_pos[1], self.white_to_move)
-        
-        # Check for checkmate and stalemate
-        has_valid_moves = False
-        for r in range(8):
-            for c in range(8):
-                piece = self.board_state[r][c]
-                if piece != '--' and piece[0] == ('w' if self.white_to_move else 'b'):
-                    moves = self.get_valid_moves_for_piece(r, c)
-                    if moves:
-                        has_valid_moves = True
-                        break
-            if has_valid_moves:
-                break
-        
-        if not has_valid_moves:
-            self.checkmate = self.in_check
-            self.stalemate = not self.in_check
-            self.checkmate_sound.play()
-        
-        elif self.in_check:
-            self.check_sound.play()
-        
-        # Check for draw by insufficient material
-        if self.is_insufficient():
-            self.insufficient = True
-            self.checkmate_sound.play()
+            self.move_sound.play()
 
-    def get_valid_moves_for_piece(self, start_row, start_col, check_check=True):
-        """Get all valid moves for a piece"""
-        piece = self.board_state[start_row][start_col]
-        moves = []
-        valid_moves = []
-        
-        if piece == '--':
-            return moves
-            
-        piece_type = piece[1]
-        piece_color = piece[0]
-        
-        # Pawn moves
-        if piece_type == 'P':
-            direction = 1 if piece_color == 'b' else -1
-            
-            # Forward move
-            if 0 <= start_row + direction < 8 and self.board_state[start_row + direction][start_col] == '--':
-                moves.append((start_row + direction, start_col))
-                # Initial two-square move
-                if (piece_color == 'w' and start_row == 6) or (piece_color == 'b' and start_row == 1):
-                    if self.board_state[start_row + 2*direction][start_col] == '--':
-                        moves.append((start_row + 2*direction, start_col))
-            
-            # Captures
-            for col_offset in [-1, 1]:
-                if 0 <= start_col + col_offset < 8 and 0 <= start_row + direction < 8:
-                    target_piece = self.board_state[start_row + direction][start_col + col_offset]
-                    if target_piece != '--' and target_piece[0] != piece_color:
-                        moves.append((start_row + direction, start_col + col_offset))
-
-            # En passant capture
-            if self.last_move:
-                last_start_row, last_start_col, last_end_row, last_end_col = self.last_move
-                if abs(last_end_row - last_start_row) == 2 and abs(last_end_col - start_col) == 1:
-                    if last_end_row == start_row and self.board_state[last_end_row][last_end_col] == ('wP' if piece_color == 'b' else 'bP'):
-                        potential_move = (start_row + direction, last_end_col)
-
-                        # Validate the en passant move does not leave the king in check
-                        temp_board = deepcopy(self.board_state)
-                        self.board_state[start_row][start_col] = '--'
-                        self.board_state[last_end_row][last_end_col] = '--'
-                        self.board_state[start_row + direction][last_end_col] = piece
-
-                        king_pos = self.find_king(piece_color == 'w')
-                        if not self.is_under_attack(king_pos[0], king_pos[1], piece_color == 'w'):
-                            moves.append(potential_move)
-                            valid_moves.append(potential_move)
-                        
-                        self.board_state = temp_board
-
-
-        # Rook moves
-        elif piece_type == 'R':
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-            for dr, dc in directions:
-                for i in range(1, 8):
-                    end_row = start_row + dr * i
-                    end_col = start_col + dc * i
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        target_piece = self.board_state[end_row][end_col]
-                        if target_piece == '--':
-                            moves.append((end_row, end_col))
-                        elif target_piece[0] != piece_color:
-                            moves.append((end_row, end_col))
-                            break
-                        else:
-                            break
-                    else:
-                        break
-        
-        # Knight moves
-        elif piece_type == 'N':
-            knight_moves = [
-                (-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                (1, -2), (1, 2), (2, -1), (2, 1)
-            ]
-            for dr, dc in knight_moves:
-                end_row = start_row + dr
-                end_col = start_col + dc
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    target_piece = self.board_state[end_row][end_col]
-                    if target_piece == '--' or target_piece[0] != piece_color:
-                        moves.append((end_row, end_col))
-        
-        # Bishop moves
-        elif piece_type == 'B':
-            directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in directions:
-                for i in range(1, 8):
-                    end_row = start_row + dr * i
-                    end_col = start_col + dc * i
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        target_piece = self.board_state[end_row][end_col]
-                        if target_piece == '--':
-                            moves.append((end_row, end_col))
-                        elif target_piece[0] != piece_color:
-                            moves.append((end_row, end_col))
-                            break
-                        else:
-                            break
-                    else:
-                        break
-        
-        # Queen moves (combination of Rook and Bishop)
-        elif piece_type == 'Q':
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0),
-                         (1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in directions:
-                for i in range(1, 8):
-                    end_row = start_row + dr * i
-                    end_col = start_col + dc * i
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        target_piece = self.board_state[end_row][end_col]
-                        if target_piece == '--':
-                            moves.append((end_row, end_col))
-                        elif target_piece[0] != piece_color:
-                            moves.append((end_row, end_col))
-                            break
-                        else:
-                            break
-                    else:
-                        break
-        
-        # King moves
-        elif piece_type == 'K':
-            # Normal king moves
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0),
-                         (1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in directions:
-                end_row = start_row + dr
-                end_col = start_col + dc
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    target_piece = self.board_state[end_row][end_col]
-                    if target_piece == '--' or target_piece[0] != piece_color:
-                        moves.append((end_row, end_col))
-            
-            # Castling moves
-            if check_check:  # Only check castling if we're checking for check
-                # Check kingside castle
-                if self.can_castle('k'):
-                    moves.append((start_row, start_col + 2))
-                # Check queenside castle
-                if self.can_castle('q'):
-                    moves.append((start_row, start_col - 2))
-        
-        # Filter moves that would leave/put the king in check
-        if check_check:
-            for move in moves:
-                # Make temporary move
-                temp_board = deepcopy(self.board_state)
-                end_row, end_col = move
-                self.board_state[end_row][end_col] = self.board_state[start_row][start_col]
-                self.board_state[start_row][start_col] = '--'
-                
-                # Check if king is in check after move
-                king_pos = self.find_king(piece_color == 'w')
-                if not self.is_under_attack(king_pos[0], king_pos[1], piece_color == 'w'):
-                    valid_moves.append(move)
-                
-                # Restore board
-                self.board_state = temp_board
-            
-            return valid_moves
-        
-        return moves
+        if not self.state.awaiting_promotion:
+            self.play_status_sound()
+
+    def is_ai_turn(self):
+        """Check if the computer should move now"""
+        return (self.ai_color is not None
+                and not self.ai_paused
+                and self.ai_color == ('w' if self.state.white_to_move else 'b')
+                and not self.state.awaiting_promotion
+                and not self.state.is_game_over())
+
+    def update_ai(self):
+        """Start the computer's search on its turn and play the move once the search is done"""
+        if self.search_handle is not None:
+            if self.search_handle.done():
+                handle = self.search_handle
+                self.search_handle = None
+                if not handle.aborted and handle.result is not None:
+                    self.make_move(*handle.result)
+        elif self.is_ai_turn():
+            self.search_handle = SearchHandle(self.searcher, self.state).start()
+
+    def stop_ai(self):
+        """Abort any running search, discarding its move"""
+        if self.search_handle is not None:
+            self.search_handle.abort()
+            self.search_handle.wait()
+            self.search_handle = None
 
     def handle_click(self, row, col):
         # If waiting for promotion choice, ignore board clicks
-        if self.awaiting_promotion:
+        if self.state.awaiting_promotion:
             return
             
-        if self.checkmate or self.stalemate or self.insufficient:
+        if self.state.is_game_over() or self.is_ai_turn():
             return
             
         if self.selected_piece is None:
-            piece = self.board_state[row][col]
-            if piece != '--' and ((piece[0] == 'w' and self.white_to_move) or 
-                                (piece[0] == 'b' and not self.white_to_move)):
+            piece = self.state.board_state[row][col]
+            if piece != '--' and ((piece[0] == 'w' and self.state.white_to_move) or 
+                                (piece[0] == 'b' and not self.state.white_to_move)):
                 self.selected_piece = (row, col)
-                self.valid_moves = self.get_valid_moves_for_piece(row, col)
+                self.valid_moves = self.state.legal_targets(row, col)
         else:
             start_row, start_col = self.selected_piece
             if (row, col) == (start_row, start_col):  # Clicked same square
@@ -689,40 +504,90 @@ class ChessBoard:
                 self.selected_piece = None
                 self.valid_moves = []
             else:  # Clicked different square
-                piece = self.board_state[row][col]
-                if piece != '--' and ((piece[0] == 'w' and self.white_to_move) or 
-                                    (piece[0] == 'b' and not self.white_to_move)):
+                piece = self.state.board_state[row][col]
+                if piece != '--' and ((piece[0] == 'w' and self.state.white_to_move) or 
+                                    (piece[0] == 'b' and not self.state.white_to_move)):
                     # If clicking another valid piece, select it instead
                     self.selected_piece = (row, col)
-                    self.valid_moves = self.get_valid_moves_for_piece(row, col)
+                    self.valid_moves = self.state.legal_targets(row, col)
                 else:
                     # If clicking an invalid square, deselect
                     self.selected_piece = None
                     self.valid_moves = []
 
+    def undo_move(self):
+        """Take back the last move and clear any selection or drag"""
+        self.dragging = False
+        self.drag_piece = None
+        self.drag_pos = None
+        self.drag_start = None
+        self.selected_piece = None
+        self.valid_moves = []
+        self.stop_ai()
+        self.stop_hint()
+        undone = self.state.unmake_move()
+        # Against the computer, also take back its reply so it is the player's turn again
+        if undone and self.is_ai_turn():
+            self.state.unmake_move()
+        return undone
+
+    def save_game(self):
+        """Append the game so far to the PGN file"""
+        players = {'w': 'Player', 'b': 'Player'}
+        if self.ai_color:
+            players[self.ai_color] = 'Computer'
+        headers = {'Event': 'Casual game', 'Date': time.strftime('%Y.%m.%d'),
+                   'White': players['w'], 'Black': players['b']}
+        with open(self.pgn_path, 'a') as out:
+            out.write(write_pgn(self.state, headers))
+
     def run_game(self):
         running = True
         mouse_pressed = False
         
         while running:
+            frame_start = time.perf_counter()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.full_redraw = True
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:  # Left click
                         mouse_pressed = True
                         pos = pygame.mouse.get_pos()
                         self.mouse_start_pos = pos
                         
-                        if self.awaiting_promotion:
-                            if self.handle_promotion_click(pos):
-                                self.white_to_move = not self.white_to_move
+                        if self.state.awaiting_promotion:
+                            self.handle_promotion_click(pos)
                         elif pos[1] < self.BOARD_SIZE:
                             col = pos[0] // self.SQUARE_SIZE
                             row = pos[1] // self.SQUARE_SIZE
                             # Just handle as click initially - don't start drag yet
                             self.handle_click(row, col)
                 
+                elif event.type == pygame.KEYDOWN:
+                    # Backspace or U takes back the last move
+                    if event.key in (pygame.K_BACKSPACE, pygame.K_u):
+                        self.undo_move()
+                        mouse_pressed = False
+                    # S appends the game to the PGN file
+                    elif event.key == pygame.K_s:
+                        self.save_game()
+                    # H highlights a suggested move
+                    elif event.key == pygame.K_h:
+                        self.show_hint()
+                    # M makes the computer move now with its best move so far
+                    elif event.key == pygame.K_m and self.search_handle:
+                        self.search_handle.move_now()
+                    # Escape aborts the computer's search and hands it the board, or gives it back
+                    elif event.key == pygame.K_ESCAPE:
+                        if self.search_handle:
+                            self.stop_ai()
+                            self.ai_paused = True
+                        else:
+                            self.ai_paused = False
+                
                 elif event.type == pygame.MOUSEBUTTONUP:
                     if event.button == 1:  # Left click release
                         if self.dragging:  # End drag if we were dragging
@@ -748,14 +613,88 @@ class ChessBoard:
                     if self.dragging:
                         self.update_drag(event.pos)
 
-            self.draw_board()
-            self.draw_pieces()
-            if self.awaiting_promotion:
-                self.draw_promotion_options()
-            pygame.display.flip()
+            # Only repaint what changed; an idle board costs no drawing at all
+            dirty = self.render()
+            if dirty:
+                pygame.display.update(dirty)
+
+            # Never blocks: the searches run on worker threads and are polled here
+            self.update_ai()
+            self.update_hint()
+            if self.profiler is not None:
+                self.profiler.frame_done(time.perf_counter() - frame_start)
+            self.clock.tick(self.fps)
 
+        self.stop_ai()
+        self.stop_hint()
         pygame.quit()
 
+def _benchmark(frames=300):
+    """Time full frames and count the surfaces, fonts and text renders each one creates"""
+    created = collections.Counter()
+    real_surface, real_font = pygame.Surface, pygame.font.Font
+
+    class CountedSurface(real_surface):
+        def __init__(self, *args, **kwargs):
+            created['surfaces'] += 1
+            super().__init__(*args, **kwargs)
+
+    class CountedFont(real_font):
+        def __init__(self, *args, **kwargs):
+            created['fonts'] += 1
+            super().__init__(*args, **kwargs)
+
+        def render(self, *args, **kwargs):
+            created['text renders'] += 1
+            return super().render(*args, **kwargs)
+
+    pygame.Surface, pygame.font.Font = CountedSurface, CountedFont
+    try:
+        game = ChessBoard()
+        game.handle_click(6, 4)  # Selection with highlighted moves
+        for name in ('selection', 'promotion'):
+            if name == 'promotion':
+                game.state.load_fen('8/P6k/8/8/8/8/8/K7 w - - 0 1')
+                game.handle_click(1, 0)
+                game.handle_click(0, 0)
+            for _ in range(20):
+                game.full_redraw = True
+                game.render()
+            created.clear()
+            start = time.perf_counter()
+            for _ in range(frames):
+                game.full_redraw = True
+                game.render()
+            elapsed = time.perf_counter() - start
+            counts = '  '.join(f"{kind} {created[kind] / frames:.2f}"
+                               for kind in ('surfaces', 'fonts', 'text renders'))
+            print(f"{name:10} full frame {elapsed / frames * 1000:.3f} ms  per frame: {counts}")
+    finally:
+        pygame.Surface, pygame.font.Font = real_surface, real_font
+        pygame.quit()
+
+
 if __name__ == "__main__":
-    game = ChessBoard()
-    game.run_game()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Play chess")
+    parser.add_argument('--ai', choices=['white', 'black'], help="let the computer play this side")
+    parser.add_argument('--think', type=float, default=2.0, help="computer thinking time per move in seconds")
+    parser.add_argument('--fps', type=int, default=60, help="frame rate cap, 0 for uncapped")
+    parser.add_argument('--fen', help="start from this position instead of the initial one")
+    parser.add_argument('--pgn', default='games.pgn', help="file the S key appends the game to")
+    parser.add_argument('--book', help="opening book file for the computer, built with book.py")
+    parser.add_argument('--tablebases', default='tablebases', help="directory of endgame tables from tablebase.py")
+    parser.add_argument('--benchmark', action='store_true', help="time full frame redraws and exit")
+    parser.add_argument('--profile', help="time the rules, search and drawing, show the frame rate over the board "
+                                          "and write the numbers here on exit (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark()
+        raise SystemExit
+
+    game = ChessBoard(ai_color=args.ai[0] if args.ai else None, think_time=args.think, fps=args.fps,
+                      fen=args.fen, pgn_path=args.pgn, book_path=args.book,
+                      tablebase_dir=args.tablebases, profiler=Profiler().enable() if args.profile else None)
+    game.run_game()
+    if args.profile:
+        game.profiler.write(args.profile)
\ No newline at end of file
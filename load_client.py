@@ -0,0 +1,145 @@
+"""Load generator and benchmark for server.py: many connections playing random games at once.
+
+Each connection starts its share of the games, plays both colours in them
+and sends one random legal move at a time, timing each from sending it to
+receiving its update. Every update's FEN is checked against a local copy
+of the game. Finished games are left and replaced by new ones, so the
+number of live games stays the same. Without --port a server is started
+in a child process, so the whole test runs offline.
+
+    python load_client.py --connections 50 --games 2000 --moves 20000
+    python load_client.py --port 8765 --connections 10 --games 100
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from game_state import GameState, move_name
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port, limit=1 << 16))
+
+    async def request(self, line):
+        """Send a command and return the words of its reply"""
+        self.writer.write(line.encode() + b'\n')
+        await self.writer.drain()
+        reply = (await self.reader.readline()).decode().split()
+        if not reply or reply[0] == 'error':
+            raise RuntimeError(f"{line!r} failed: {' '.join(reply) or 'connection closed'}")
+        return reply
+
+    async def close(self):
+        self.writer.write(b'quit\n')
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play(connection, games, moves, rng, latencies, max_plies=200):
+    """Keep games going on one connection until it has played its moves. Returns the FEN mismatches seen"""
+    boards = {}
+    mismatches = 0
+
+    async def start_game():
+        game_id = (await connection.request('new'))[2]
+        await connection.request(f'join {game_id}')
+        boards[game_id] = GameState()
+
+    for _ in range(games):
+        await start_game()
+
+    played = 0
+    while played < moves:
+        for game_id in list(boards):
+            state = boards[game_id]
+            move = rng.choice(state.generate_legal_moves())
+            start = time.perf_counter()
+            reply = await connection.request(f'move {game_id} {move_name(move)}')
+            latencies.append(time.perf_counter() - start)
+            state.make_move(*move)
+            if ' '.join(reply[4:]) != state.to_fen():
+                mismatches += 1
+            played += 1
+            if state.is_game_over() or len(state.move_stack) >= max_plies:
+                await connection.request(f'leave {game_id}')
+                del boards[game_id]
+                await start_game()
+            if played >= moves:
+                break
+    return mismatches
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(host, port, connections, games, moves, seed=1):
+    server = None
+    if port is None:
+        server = await asyncio.create_subprocess_exec(sys.executable, SERVER, '--host', host, '--port', '0',
+                                                      stdout=asyncio.subprocess.PIPE)
+        # First line is 'listening on host:port'
+        port = int((await server.stdout.readline()).decode().rsplit(':', 1)[1])
+
+    try:
+        clients = [await Connection.open(host, port) for _ in range(connections)]
+        latencies = []
+        start = time.perf_counter()
+        mismatches = await asyncio.gather(*(
+            play(client, games // connections + (index < games % connections),
+                 moves // connections + (index < moves % connections), random.Random(seed + index), latencies)
+            for index, client in enumerate(clients)))
+        elapsed = time.perf_counter() - start
+
+        # Memory is read while every game is still open
+        monitor = await Connection.open(host, port)
+        stats = dict(word.split('=') for word in (await monitor.request('stats'))[2:])
+        await monitor.close()
+        for client in clients:
+            await client.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            await server.wait()
+
+    latencies.sort()
+    live = int(stats['games'])
+    print(f"{len(latencies)} moves on {connections} connections, {live} live games, in {elapsed:.2f}s: "
+          f"{len(latencies) / elapsed:.0f} moves/s")
+    print(f"move latency p50 {percentile(latencies, 0.5) * 1000:.2f} ms  p99 {percentile(latencies, 0.99) * 1000:.2f} ms"
+          f"  max {latencies[-1] * 1000:.2f} ms")
+    print(f"server memory {int(stats['bytes']) / 1024 / 1024:.1f} MB for the games, "
+          f"{int(stats['bytes']) / max(live, 1) / 1024:.1f} KB per game, largest {int(stats['max_bytes']) / 1024:.1f} KB")
+    print(f"FEN mismatches {sum(mismatches)}")
+    return sum(mismatches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play random games against server.py and time the moves")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="server to use, by default one is started")
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--games', type=int, default=1000, help="live games, spread over the connections")
+    parser.add_argument('--moves', type=int, default=20000, help="moves to play in total")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.games < args.connections:
+        parser.error("need at least one game per connection")
+    mismatches = asyncio.run(run(args.host, args.port, args.connections, args.games, args.moves, args.seed))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
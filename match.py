@@ -0,0 +1,243 @@
+"""Headless engine-vs-engine matches for tuning.
+
+Every pair of engine configurations plays each opening twice, once with
+each colour, with games spread over a pool of worker processes. Games are
+played on GameState with make_move, so the normal end-of-game rules
+decide them; a game still going after --max-plies is adjudicated a draw.
+All games are written to a PGN file and a score and Elo summary with 95%
+error bars is printed.
+
+    python match.py --engine fast:depth=2 --engine slow:depth=3 --rounds 2
+    python match.py --engine a:time=0.1 --engine b:nodes=3000 --openings openings.txt --workers 8
+"""
+
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from book import OpeningBook
+from game_state import GameState
+from pgn import parse_san, write_pgn
+from search import Searcher
+
+# A few balanced openings, as SAN moves from the initial position
+OPENINGS = [
+    'e4 e5 Nf3 Nc6 Bb5',
+    'e4 c5 Nf3 d6',
+    'e4 e6 d4 d5',
+    'e4 c6 d4 d5',
+    'd4 d5 c4 e6',
+    'd4 Nf6 c4 g6',
+    'd4 Nf6 c4 e6 Nc3 Bb4',
+    'c4 e5 Nc3 Nf6',
+    'Nf3 d5 g3',
+    'e4 e5 Nf3 Nf6',
+]
+
+
+class Engine:
+    """A named search configuration with its per-move limits"""
+
+    def __init__(self, name, depth=64, nodes=None, time_limit=None, tt_size_mb=16, book=None):
+        self.name = name
+        self.depth = depth
+        self.nodes = nodes
+        self.time_limit = time_limit
+        self.tt_size_mb = tt_size_mb
+        self.book = book  # Opening book path, opened in each game's process
+
+    @classmethod
+    def parse(cls, spec):
+        """Build an engine from 'name:key=value,...' with keys depth, nodes, time (seconds), tt (MB) and book (path)"""
+        name, _, options = spec.partition(':')
+        kwargs = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if key == 'depth':
+                kwargs['depth'] = int(value)
+            elif key == 'nodes':
+                kwargs['nodes'] = int(value)
+            elif key == 'time':
+                kwargs['time_limit'] = float(value)
+            elif key == 'tt':
+                kwargs['tt_size_mb'] = float(value)
+            elif key == 'book':
+                kwargs['book'] = value
+            else:
+                raise ValueError(f"Unknown engine option {key!r} in {spec!r}")
+        if 'depth' not in kwargs and 'nodes' not in kwargs and 'time_limit' not in kwargs:
+            raise ValueError(f"Engine {spec!r} needs a depth, nodes or time limit")
+        return cls(name, **kwargs)
+
+    def searcher(self):
+        return Searcher(max_depth=self.depth, time_limit=self.time_limit, node_limit=self.nodes,
+                        tt_size_mb=self.tt_size_mb, book=OpeningBook(self.book) if self.book else None)
+
+
+def start_position(opening):
+    """GameState for an opening given as a FEN or as SAN moves from the initial position"""
+    if '/' in opening:
+        return GameState.from_fen(opening)
+    state = GameState()
+    for san in opening.split():
+        state.make_move(*parse_san(state, san))
+    return state
+
+
+def play_game(white, black, opening, max_plies=300, event='Engine match', round_name='?'):
+    """Worker entry point: play one game and return (result, termination, pgn_text, tt).
+
+    tt holds each side's transposition table (probes, hits, fill rate) at the end of the game.
+    """
+    state = start_position(opening)
+    searchers = {True: white.searcher(), False: black.searcher()}
+    termination = 'normal'
+    plies = 0
+    try:
+        while not state.is_game_over():
+            if plies >= max_plies:
+                termination = 'adjudication'
+                break
+            move = searchers[state.white_to_move].search(state)
+            if move is None:
+                break
+            state.make_move(*move)
+            plies += 1
+    finally:
+        for searcher in searchers.values():
+            if searcher.book is not None:
+                searcher.book.close()
+    tt = {'w' if white_side else 'b': (searcher.tt.probes, searcher.tt.hits, searcher.tt.fill_rate())
+          for white_side, searcher in searchers.items() if searcher.tt is not None}
+
+    if state.checkmate:
+        result = '0-1' if state.white_to_move else '1-0'
+    else:
+        result = '1/2-1/2'
+    headers = {'Event': event, 'Round': round_name, 'White': white.name, 'Black': black.name,
+               'Termination': termination}
+    return result, termination, write_pgn(state, headers, result), tt
+
+
+def elo_estimate(scores):
+    """Elo difference and its 95% error margin from one side's per-game scores (1, 0.5 or 0)"""
+    count = len(scores)
+    mean = sum(scores) / count
+    deviation = math.sqrt(sum((score - mean) ** 2 for score in scores) / count)
+    margin = 1.96 * deviation / math.sqrt(count)
+
+    def elo(score):
+        score = min(max(score, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / score - 1)
+
+    return elo(mean), (elo(min(mean + margin, 1)) - elo(max(mean - margin, 0))) / 2
+
+
+def schedule(engines, openings, rounds):
+    """Yield (white, black, opening, round_name) for every game: each opening twice per pairing and round"""
+    number = 0
+    for first, second in itertools.combinations(engines, 2):
+        for round_index in range(rounds):
+            for opening in openings:
+                for white, black in ((first, second), (second, first)):
+                    number += 1
+                    yield white, black, opening, f"{round_index + 1}.{number}"
+
+
+def run_match(engines, openings, rounds=1, workers=None, max_plies=300, pgn_path='match.pgn'):
+    """Play the whole schedule and write the games to pgn_path.
+
+    Returns {(engine_name, opponent_name): [scores]} from the first engine's side, and
+    {engine_name: [tt probes, tt hits, sum of end-of-game fill rates, games]}.
+    """
+    workers = workers or os.cpu_count() or 1
+    games = list(schedule(engines, openings, rounds))
+    scores = {}
+    tt_totals = {}
+    with open(pgn_path, 'w') as out:
+        if workers == 1:
+            outcomes = (play_game(white, black, opening, max_plies, round_name=round_name)
+                        for white, black, opening, round_name in games)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(play_game, white, black, opening, max_plies, round_name=round_name)
+                       for white, black, opening, round_name in games]
+            outcomes = (future.result() for future in futures)
+        try:
+            for (white, black, _, _), (result, _, text, tt) in zip(games, outcomes):
+                out.write(text)
+                for engine, side in ((white, 'w'), (black, 'b')):
+                    if side in tt:
+                        totals = tt_totals.setdefault(engine.name, [0, 0, 0.0, 0])
+                        probes, hits, fill = tt[side]
+                        totals[0] += probes
+                        totals[1] += hits
+                        totals[2] += fill
+                        totals[3] += 1
+                white_score = {'1-0': 1.0, '0-1': 0.0}.get(result, 0.5)
+                scores.setdefault((white.name, black.name), []).append(white_score)
+                scores.setdefault((black.name, white.name), []).append(1 - white_score)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return scores, tt_totals
+
+
+def print_summary(engines, scores, tt_totals=None):
+    for first, second in itertools.combinations(engines, 2):
+        results = scores.get((first.name, second.name), [])
+        if not results:
+            continue
+        wins, draws = results.count(1.0), results.count(0.5)
+        losses = len(results) - wins - draws
+        elo, margin = elo_estimate(results)
+        print(f"{first.name} vs {second.name}: +{wins} ={draws} -{losses}  "
+              f"score {sum(results) / len(results):.1%}  Elo {elo:+.0f} +/- {margin:.0f}")
+    for engine in engines:
+        results = [score for (name, _), engine_scores in scores.items() if name == engine.name
+                   for score in engine_scores]
+        if results:
+            line = f"{engine.name:12} {sum(results):g}/{len(results)}"
+            probes, hits, fill, games = (tt_totals or {}).get(engine.name, (0, 0, 0.0, 0))
+            if games:
+                line += (f"  TT {engine.tt_size_mb:g}MB  probes {probes}  hit rate {hits / max(probes, 1):.1%}"
+                         f"  fill {fill / games:.1%} at game end")
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine configurations against each other")
+    parser.add_argument('--engine', action='append', default=[],
+                        help="name:key=value,... with depth, nodes, time (seconds per move), tt (MB) or book (path)")
+    parser.add_argument('--openings', help="file of openings, one FEN or line of SAN moves per line")
+    parser.add_argument('--rounds', type=int, default=1, help="times each pairing plays every opening pair")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-plies', type=int, default=300, help="adjudicate a draw after this many plies")
+    parser.add_argument('--pgn', default='match.pgn', help="file to write the games to")
+    args = parser.parse_args(argv)
+
+    engines = [Engine.parse(spec) for spec in args.engine or ['depth1:depth=1', 'depth2:depth=2']]
+    if len(engines) < 2:
+        parser.error("need at least two engines")
+    if args.openings:
+        with open(args.openings) as lines:
+            openings = [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+    else:
+        openings = OPENINGS
+
+    start = time.perf_counter()
+    scores, tt_totals = run_match(engines, openings, args.rounds, args.workers, args.max_plies, args.pgn)
+    elapsed = time.perf_counter() - start
+    games = sum(len(results) for results in scores.values()) // 2
+    print(f"{games} games in {elapsed:.1f}s with {args.workers} workers, written to {args.pgn}")
+    print_summary(engines, scores, tt_totals)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
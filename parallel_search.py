@@ -0,0 +1,119 @@
+"""Multi-core search by splitting the root moves across a pool of searcher processes.
+
+Threads cannot run the pure-Python search in parallel because of the GIL,
+so each worker process gets a pickled copy of the position and a share of
+the root moves, searches them to a fixed depth with its own Searcher, and
+reports its best move. The best score wins; ties go to the move that was
+ordered first, so results do not depend on which worker finishes first.
+
+    python parallel_search.py --depth 4 --workers 4    # speedup against one process
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from game_state import GameState, START_FEN, move_name
+from search import Searcher
+
+
+def _search_share(state, moves, depth, tt_size_mb):
+    """Worker entry point: best of the given root moves as (move, score, nodes, transposition table stats)"""
+    searcher = Searcher(max_depth=depth, tt_size_mb=tt_size_mb)
+    move = searcher.search(state, root_moves=moves)
+    return move, searcher.score, searcher.nodes, searcher.tt.stats() if searcher.tt else "TT off"
+
+
+def _warm_up():
+    return os.getpid()
+
+
+class ParallelSearcher:
+    def __init__(self, workers=None, depth=4, tt_size_mb=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.depth = depth
+        self.tt_size_mb = tt_size_mb  # Per worker process
+        self.nodes = 0
+        self.score = 0
+        self.tt_stats = []  # Transposition table stats line of each process in the last search
+        self._pool = None
+
+    def search(self, state):
+        """Best move for the side to move at the fixed depth, or None if there is no legal move"""
+        moves = state.generate_legal_moves()
+        if not moves:
+            return None
+
+        if self.workers == 1:
+            # Same search as a plain Searcher, run in this process
+            move, self.score, self.nodes, stats = _search_share(state, moves, self.depth, self.tt_size_mb)
+            self.tt_stats = [stats]
+            return move
+
+        # Order the root cheaply, then deal moves round-robin so every worker gets a mix
+        ordering = Searcher(max_depth=1, tt_size_mb=0)
+        ordering.search(state)
+        if ordering.best_move in moves:
+            moves.remove(ordering.best_move)
+            moves.insert(0, ordering.best_move)
+        shares = [moves[index::self.workers] for index in range(self.workers)]
+
+        self.start()
+        futures = [self._pool.submit(_search_share, state, share, self.depth, self.tt_size_mb)
+                   for share in shares if share]
+        results = [future.result() for future in futures]
+
+        self.nodes = sum(result[2] for result in results)
+        self.tt_stats = [result[3] for result in results]
+        best_move, self.score = max(results, key=lambda result: (result[1], -moves.index(result[0])))[:2]
+        return best_move
+
+    def start(self):
+        """Start the worker processes ahead of the first search"""
+        if self._pool is None and self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            # Make every worker import the engine now rather than during a search
+            for future in [self._pool.submit(_warm_up) for _ in range(self.workers)]:
+                future.result()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare parallel root-split search with a single process")
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    state = GameState.from_fen(args.fen)
+
+    single = ParallelSearcher(workers=1, depth=args.depth)
+    start = time.perf_counter()
+    single_move = single.search(state)
+    single_time = time.perf_counter() - start
+    print(f"1 process:   {move_name(single_move)} score {single.score}  "
+          f"{single.nodes} nodes  {single_time:.2f}s")
+    print(f"  {single.tt_stats[0]}")
+
+    parallel = ParallelSearcher(workers=args.workers, depth=args.depth)
+    try:
+        parallel.start()
+        start = time.perf_counter()
+        parallel_move = parallel.search(state)
+        parallel_time = time.perf_counter() - start
+    finally:
+        parallel.close()
+    print(f"{args.workers} processes: {move_name(parallel_move)} score {parallel.score}  "
+          f"{parallel.nodes} nodes  {parallel_time:.2f}s")
+    for stats in parallel.tt_stats:
+        print(f"  {stats}")
+    print(f"Speedup: {single_time / parallel_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
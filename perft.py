@@ -0,0 +1,152 @@
+"""Perft: count the leaf nodes of the legal move tree to check and time the move generator.
+
+    python perft.py 4                       # start position to depth 4
+    python perft.py 3 --fen "<fen>" --divide
+    python perft.py --suite                 # known positions, exits non-zero on a mismatch
+    python perft.py --pieces                # per-piece get_valid_moves_for_piece timings
+"""
+
+import argparse
+import sys
+import time
+
+from bitboard import BitboardGameState
+from game_state import GameState, START_FEN, move_name
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+# (name, FEN, node counts from depth 1 upwards)
+SUITE = [
+    ('start position', START_FEN, [20, 400, 8902, 197281]),
+    ('kiwipete', KIWIPETE, [48, 2039, 97862]),
+    ('rook endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238]),
+    ('promotions and pins', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467]),
+    ('promotion into check', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379]),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890]),
+    ('illegal en passant 1', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', [18, 92, 1670, 10138]),
+    ('illegal en passant 2', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', [13, 102, 1266, 10276]),
+    ('en passant gives check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', [15, 126, 1928, 13931]),
+    ('short castle gives check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1', [15, 66, 1198, 6399]),
+    ('long castle gives check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1', [16, 71, 1286, 7418]),
+    ('castling rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1', [26, 1141, 27826]),
+    ('castling through check', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1', [44, 1494, 50509]),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1', [11, 133, 1442, 19174]),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1', [29, 165, 5160, 31961]),
+    ('promote to give check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1', [9, 40, 472, 2661]),
+    ('underpromote to check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1', [6, 27, 273, 1329]),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1', [2, 6, 13, 63]),
+    ('stalemate and checkmate', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1', [10, 25, 268, 926]),
+    ('double check', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1', [37, 183, 6559, 23527]),
+]
+
+
+def perft(state, depth):
+    """Number of leaf nodes of the legal move tree below the current position"""
+    if depth == 0:
+        return 1
+    moves = state.generate_legal_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        undo = state.push_move(*move)
+        nodes += perft(state, depth - 1)
+        state.pop_move(undo)
+    return nodes
+
+
+def divide(state, depth):
+    """Leaf node count below each root move, as a list of (move, nodes)"""
+    results = []
+    for move in state.generate_legal_moves():
+        undo = state.push_move(*move)
+        results.append((move, perft(state, depth - 1)))
+        state.pop_move(undo)
+    return results
+
+
+def run_suite(state_class, max_nodes):
+    """Check every suite position up to the deepest depth within max_nodes. Returns the failure count"""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in SUITE:
+        for depth, expected in enumerate(counts, start=1):
+            if expected > max_nodes:
+                break
+            state = state_class.from_fen(fen)
+            start = time.perf_counter()
+            nodes = perft(state, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            ok = nodes == expected
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name:26} depth {depth}  {nodes:>9} nodes"
+                  + ('' if ok else f"  expected {expected}"))
+    print(f"{failures} failures, {total_nodes} nodes in {total_time:.2f}s "
+          f"({total_nodes / max(total_time, 1e-9):.0f} nodes/s)")
+    return failures
+
+
+def piece_benchmark(state_class, repeat=200):
+    """Time get_valid_moves_for_piece per piece kind over the suite positions, with and without the check test"""
+    squares = {kind: [] for kind in 'PNBRQK'}
+    for _, fen, _ in SUITE:
+        state = state_class.from_fen(fen)
+        for row in range(8):
+            for col in range(8):
+                piece = state.board_state[row][col]
+                if piece != '--':
+                    squares[piece[1]].append((state, row, col))
+
+    print(f"{'piece':6} {'squares':>7} {'pseudo-legal':>13} {'legal':>10}")
+    for kind, found in squares.items():
+        timings = []
+        for check_check in (False, True):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for state, row, col in found:
+                    state.get_valid_moves_for_piece(row, col, check_check)
+            timings.append((time.perf_counter() - start) / (repeat * len(found)) * 1e6)
+        print(f"{kind:6} {len(found):>7} {timings[0]:>10.2f} us {timings[1]:>7.2f} us")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move generator check and benchmark")
+    parser.add_argument('depth', type=int, nargs='?', default=3)
+    parser.add_argument('--fen', default=START_FEN, help="position to search from")
+    parser.add_argument('--divide', action='store_true', help="print node counts per root move")
+    parser.add_argument('--bitboard', action='store_true', help="use the bitboard backend")
+    parser.add_argument('--suite', action='store_true', help="run the known-count regression suite")
+    parser.add_argument('--max-nodes', type=int, default=100000,
+                        help="skip suite depths expected to exceed this many nodes")
+    parser.add_argument('--pieces', action='store_true', help="time move generation for each piece kind")
+    args = parser.parse_args(argv)
+
+    state_class = BitboardGameState if args.bitboard else GameState
+    if args.suite:
+        return 1 if run_suite(state_class, args.max_nodes) else 0
+    if args.pieces:
+        piece_benchmark(state_class)
+        return 0
+
+    state = state_class.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(state, args.depth)
+        for move, nodes in sorted(results, key=lambda result: move_name(result[0])):
+            print(f"{move_name(move)}: {nodes}")
+        nodes = sum(count for _, count in results)
+        print(f"\nMoves: {len(results)}")
+    else:
+        nodes = perft(state, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s  ({nodes / max(elapsed, 1e-9):.0f} nodes/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
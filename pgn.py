@@ -0,0 +1,378 @@
+"""Streaming PGN reading and writing.
+
+read_games() parses a PGN file one line at a time and yields each game as
+(headers, SAN moves), so archives of any size run in constant memory.
+replay() plays those moves through GameState.make_move, resolving SAN
+against the legal move generator. write_pgn() turns a game played on a
+GameState back into PGN text.
+
+    python pgn.py games.pgn                     # replay every game and report throughput
+    python pgn.py --sample games.pgn --games 1000
+"""
+
+import argparse
+import random
+import re
+import sys
+import textwrap
+import time
+from copy import deepcopy
+
+from bitboard import BitboardGameState
+from game_state import GameState, START_FEN, parse_square, square_name
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+_HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments (possibly running past the end of the line), variations, NAGs and move text
+_TOKEN = re.compile(r'\{[^}]*\}?|;.*|\$\d+|[()]|[^\s{}();$]+')
+# Move number glued to the front of a token, as in '12.e4' or '12...Nf6'; never part of '0-0'
+_MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+# Movetext that must read and replay to the given SAN moves, checked by --check
+READER_CASES = [
+    ('castling with zeros', '1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. 0-0 Nf6 1-0',
+     ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5', 'O-O', 'Nf6']),
+    ('long castling with zeros', '1. d4 d5 2. Nc3 Nc6 3. Bf4 Bf5 4. Qd2 Qd7 5. 0-0-0 0-0-0+ *',
+     ['d4', 'd5', 'Nc3', 'Nc6', 'Bf4', 'Bf5', 'Qd2', 'Qd7', 'O-O-O', 'O-O-O']),
+    ('glued move numbers', '1.e4 e5 2.Nf3 2...Nc6 3.Bb5 a6 *', ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6']),
+]
+
+
+def read_games(lines):
+    """Yield (headers, san_moves) for each game in an iterable of PGN lines, such as an open file.
+
+    Comments, variations, NAGs and move numbers are skipped. A game ends at
+    its result token; the token fills in the Result header if it is missing.
+    """
+    headers = {}
+    moves = []
+    depth = 0  # Variation nesting
+    in_comment = False  # Inside a { } comment spanning lines
+    for line in lines:
+        if in_comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+
+        stripped = line.strip()
+        if not stripped or stripped[0] == '%':
+            continue
+        if stripped[0] == '[' and not depth:
+            # Tags after move text mean the previous game lacked a result
+            if moves:
+                yield headers, moves
+                headers, moves = {}, []
+            match = _HEADER.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+
+        for token in _TOKEN.findall(line):
+            first = token[0]
+            if first == '{':
+                if token[-1] != '}':
+                    in_comment = True
+            elif first == ';':
+                break
+            elif first == '(':
+                depth += 1
+            elif first == ')':
+                depth = max(depth - 1, 0)
+            elif depth or first == '$':
+                continue
+            elif token in RESULTS:
+                headers.setdefault('Result', token)
+                yield headers, moves
+                headers, moves = {}, []
+            else:
+                # Move numbers may be glued to the move, as in '12.e4' or '12...Nf6'
+                if first.isdigit():
+                    token = _MOVE_NUMBER.sub('', token)
+                if token and token != 'e.p.':
+                    moves.append(token)
+
+    if headers or moves:
+        yield headers, moves
+
+
+def _leaves_king_safe(state, move):
+    undo = state.push_move(*move)
+    is_white = not state.white_to_move
+    king = state.find_king(is_white)
+    safe = king is None or not state.is_under_attack(king[0], king[1], is_white)
+    state.pop_move(undo)
+    return safe
+
+
+def _movers(state, piece, end_row, end_col, start_row=None, start_col=None):
+    """Squares holding piece that can legally move to the end square, optionally on a given row or column.
+
+    Pseudo-legal moves find the candidates; only those get a king safety probe.
+    """
+    board = state.board_state
+    return [(row, col)
+            for row in (range(8) if start_row is None else (start_row,))
+            for col in (range(8) if start_col is None else (start_col,))
+            if board[row][col] == piece
+            and (end_row, end_col) in state.get_valid_moves_for_piece(row, col, check_check=False)
+            and _leaves_king_safe(state, (row, col, end_row, end_col, None))]
+
+
+def parse_san(state, san):
+    """Resolve a SAN move such as 'Nbd7', 'exd6', 'O-O' or 'e8=Q+' to a move tuple.
+
+    Only pieces of the named kind are asked for their moves, so this is much
+    cheaper than generating every legal move. Raises ValueError if no legal
+    move or more than one matches.
+    """
+    text = san.rstrip('+#!?')
+    color = 'w' if state.white_to_move else 'b'
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        row = 7 if color == 'w' else 0
+        end_col = 6 if len(text) == 3 else 2
+        if state.board_state[row][4] == color + 'K' and state.can_castle('k' if end_col == 6 else 'q'):
+            return (row, 4, row, end_col, None)
+        raise ValueError(f"Illegal move: {san!r}")
+
+    promotion = None
+    if '=' in text:
+        text, promotion = text.split('=', 1)
+    elif text and text[-1] in 'QRBN':
+        text, promotion = text[:-1], text[-1]
+    if len(text) < 2 or text[-2] not in 'abcdefgh' or text[-1] not in '12345678' or \
+            (promotion is not None and promotion not in ('Q', 'R', 'B', 'N')):
+        raise ValueError(f"Bad SAN move: {san!r}")
+
+    kind = text[0] if text[0] in 'NBRQK' else 'P'
+    end_row, end_col = parse_square(text[-2:])
+    # File and/or rank of the moving piece, given to disambiguate or for pawn captures
+    start_col = start_row = None
+    for char in text[kind != 'P':-2]:
+        if char in 'abcdefgh':
+            start_col = 'abcdefgh'.index(char)
+        elif char in '12345678':
+            start_row = 8 - int(char)
+        elif char not in 'x-:':
+            raise ValueError(f"Bad SAN move: {san!r}")
+    if kind == 'P' and start_col is None:
+        start_col = end_col
+    # A pawn reaching the last rank must name its promotion, and only then
+    if (promotion is not None) != (kind == 'P' and end_row in (0, 7)):
+        raise ValueError(f"Illegal move: {san!r}")
+
+    movers = _movers(state, color + kind, end_row, end_col, start_row, start_col)
+    if len(movers) != 1:
+        raise ValueError(f"{'Ambiguous' if movers else 'Illegal'} move: {san!r}")
+    return movers[0] + (end_row, end_col, promotion)
+
+
+def move_san(state, move):
+    """SAN for a legal move in the current position, with + or # for check and mate"""
+    start_row, start_col, end_row, end_col, promotion = move
+    board = state.board_state
+    piece = board[start_row][start_col]
+    kind = piece[1]
+
+    if kind == 'K' and abs(end_col - start_col) == 2:
+        text = 'O-O' if end_col == 6 else 'O-O-O'
+    elif kind == 'P':
+        text = square_name(end_row, end_col)
+        if start_col != end_col:
+            text = 'abcdefgh'[start_col] + 'x' + text
+        if promotion:
+            text += '=' + promotion
+    else:
+        # Other pieces of the same kind that could reach the same square
+        rivals = [square for square in _movers(state, piece, end_row, end_col) if square != (start_row, start_col)]
+        prefix = ''
+        if rivals:
+            if all(col != start_col for _, col in rivals):
+                prefix = 'abcdefgh'[start_col]
+            elif all(row != start_row for row, _ in rivals):
+                prefix = str(8 - start_row)
+            else:
+                prefix = square_name(start_row, start_col)
+        capture = 'x' if board[end_row][end_col] != '--' else ''
+        text = kind + prefix + capture + square_name(end_row, end_col)
+
+    undo = state.push_move(*move)
+    king = state.find_king(state.white_to_move)
+    if king and state.is_under_attack(king[0], king[1], state.white_to_move):
+        text += '+' if state.has_any_legal_move() else '#'
+    state.pop_move(undo)
+    return text
+
+
+def start_state(headers, state_class=GameState, claim_draws=True):
+    """The position a game starts from: its FEN header, or the initial position.
+
+    claim_draws is set before the FEN is loaded, so the status already
+    follows it.
+    """
+    state = state_class()
+    state.claim_draws = claim_draws
+    if 'FEN' in headers:
+        state.load_fen(headers['FEN'])
+    return state
+
+
+def replay(headers, san_moves, state_class=GameState, claim_draws=True):
+    """Play a game through make_move, yielding (san, move, state) after each move.
+
+    Starts from the FEN header when there is one. Raises ValueError naming
+    the ply of the first move that is not legal. With claim_draws False only
+    the automatic draws (fivefold repetition and seventy-five moves) end
+    the game.
+    """
+    state = start_state(headers, state_class, claim_draws)
+    for ply, san in enumerate(san_moves, start=1):
+        try:
+            move = parse_san(state, san)
+        except ValueError as error:
+            raise ValueError(f"Ply {ply}: {error}") from None
+        state.make_move(*move)
+        yield san, move, state
+
+
+def game_result(state):
+    """PGN result of a GameState: '1-0', '0-1', '1/2-1/2', or '*' while the game goes on"""
+    if state.checkmate:
+        return '0-1' if state.white_to_move else '1-0'
+    if state.is_game_over():
+        return '1/2-1/2'
+    return '*'
+
+
+def game_moves(state):
+    """The starting position and the completed moves of a game, as (start_state, moves).
+
+    Works on a copy: the moves are taken back one by one, reading any
+    promotion piece off the board before each undo.
+    """
+    start = deepcopy(state)
+    if start.awaiting_promotion:
+        start.unmake_move()
+    moves = []
+    while start.move_stack:
+        undo = start.move_stack[-1][0]
+        placed = start.board_state[undo[2]][undo[3]]
+        moves.append(undo[:4] + (placed[1] if placed != undo[4] else None,))
+        start.unmake_move()
+    moves.reverse()
+    return start, moves
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def write_pgn(state, headers=None, result=None):
+    """PGN text for the game played on a GameState, ending with a blank line.
+
+    The result comes from the game status unless given, as for an adjudicated game.
+    """
+    start, moves = game_moves(state)
+    result = result or game_result(state)
+    tags = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+    tags.update(headers or {})
+    tags['Result'] = result
+    start_fen = start.to_fen()
+    if start_fen != START_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = start_fen
+
+    tokens = []
+    for move in moves:
+        if start.white_to_move:
+            tokens.append(f"{start.fullmove_number}.")
+        elif not tokens:
+            tokens.append(f"{start.fullmove_number}...")
+        tokens.append(move_san(start, move))
+        start.make_move(*move)
+    tokens.append(result)
+
+    tag_lines = ''.join(f'[{name} "{_escape(value)}"]\n' for name, value in tags.items())
+    return tag_lines + '\n' + textwrap.fill(' '.join(tokens), 79) + '\n\n'
+
+
+def write_sample(path, games, seed=1, max_plies=200):
+    """Write a file of random legal games, for timing the reader"""
+    rng = random.Random(seed)
+    with open(path, 'w') as out:
+        for number in range(1, games + 1):
+            state = GameState()
+            for _ in range(max_plies):
+                moves = state.generate_legal_moves()
+                if not moves or state.is_game_over():
+                    break
+                state.make_move(*rng.choice(moves))
+            out.write(write_pgn(state, {'Event': 'Random sample', 'Round': str(number)}))
+
+
+def check_reader():
+    """Read, replay, write and read back each of READER_CASES. Returns the failure count"""
+    failures = 0
+    for name, movetext, expected in READER_CASES:
+        try:
+            (headers, san_moves), = read_games([movetext])
+            state = None
+            for _, _, state in replay(headers, san_moves):
+                pass
+            (_, written), = read_games(write_pgn(state).splitlines())
+            found = [san.rstrip('+#') for san in written]
+            ok = found == expected
+        except ValueError as error:
+            found, ok = str(error), False
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + ('' if ok else f"  got {found}, expected {expected}"))
+    print(f"{failures} failures")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay PGN games through the rules and time it")
+    parser.add_argument('path', nargs='?', help="PGN file to read, or to write with --sample")
+    parser.add_argument('--check', action='store_true', help="run the movetext reader regression cases")
+    parser.add_argument('--limit', type=int, help="stop after this many games")
+    parser.add_argument('--bitboard', action='store_true', help="use the bitboard backend")
+    parser.add_argument('--sample', action='store_true', help="write random games to path instead")
+    parser.add_argument('--games', type=int, default=1000, help="number of games for --sample")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.check:
+        return 1 if check_reader() else 0
+    if args.path is None:
+        parser.error("a PGN path is needed")
+    if args.sample:
+        write_sample(args.path, args.games, args.seed)
+        print(f"Wrote {args.games} games to {args.path}")
+        return 0
+
+    state_class = BitboardGameState if args.bitboard else GameState
+    games = plies = errors = 0
+    start = time.perf_counter()
+    with open(args.path, encoding='utf-8', errors='replace') as lines:
+        for headers, san_moves in read_games(lines):
+            games += 1
+            try:
+                for _ in replay(headers, san_moves, state_class):
+                    plies += 1
+            except ValueError as error:
+                errors += 1
+                if errors <= 10:
+                    print(f"Game {games} ({headers.get('White', '?')} - {headers.get('Black', '?')}): {error}")
+            if games == args.limit:
+                break
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"{games} games, {plies} plies, {errors} with errors in {elapsed:.2f}s "
+          f"({games / elapsed:.1f} games/s, {plies / elapsed:.0f} plies/s)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
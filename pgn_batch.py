@@ -0,0 +1,158 @@
+"""Validate large PGN archives across all cores.
+
+The file is cut into byte ranges that begin and end on game boundaries,
+and a process pool replays each range through the rules with pgn.replay,
+so every move goes through GameState.make_move. Workers send back a small
+summary per chunk and the parent adds them up in file order.
+
+    python pgn_batch.py games.pgn --workers 32
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BitboardGameState
+from game_state import GameState
+from pgn import game_result, read_games, replay, start_state
+
+
+def chunk_ranges(path, games_per_chunk=500):
+    """Yield (start, end) byte ranges of a PGN file holding up to games_per_chunk whole games each.
+
+    A game starts at a tag line that does not follow another tag line.
+    """
+    start = offset = 0
+    games = 0
+    previous_tag = False
+    with open(path, 'rb') as stream:
+        for line in stream:
+            stripped = line.lstrip()
+            if stripped:
+                is_tag = stripped[:1] == b'['
+                if is_tag and not previous_tag:
+                    games += 1
+                    if games > games_per_chunk:
+                        yield start, offset
+                        start = offset
+                        games = 1
+                previous_tag = is_tag
+            offset += len(line)
+    if offset > start:
+        yield start, offset
+
+
+def _ending(state):
+    if state.checkmate:
+        return 'checkmate'
+    if state.stalemate:
+        return 'stalemate'
+    if state.insufficient:
+        return 'insufficient material'
+    if state.repetition:
+        return 'repetition'
+    if state.fifty_move:
+        return 'fifty-move rule'
+    return 'unfinished'
+
+
+def new_summary():
+    return {'games': 0, 'plies': 0, 'illegal': 0, 'mismatched': 0, 'endings': Counter(), 'errors': []}
+
+
+def merge(total, summary):
+    """Add a chunk summary into a running total. Error game numbers are shifted to count from the file start"""
+    for number, players, message in summary['errors']:
+        total['errors'].append((total['games'] + number, players, message))
+    for key in ('games', 'plies', 'illegal', 'mismatched'):
+        total[key] += summary[key]
+    total['endings'].update(summary['endings'])
+    return total
+
+
+def validate_chunk(path, start, end, bitboard=False):
+    """Worker entry point: replay the games in a byte range of a PGN file and summarise them.
+
+    A game is illegal if any move fails to resolve, and mismatched if the
+    rules end it (mate or a draw) with a different result than its Result tag.
+    Draws that only could have been claimed do not end a game here, since
+    the players may have played on to a decisive result.
+    """
+    with open(path, 'rb') as stream:
+        stream.seek(start)
+        text = stream.read(end - start).decode('utf-8', errors='replace')
+
+    state_class = BitboardGameState if bitboard else GameState
+    summary = new_summary()
+    for number, (headers, san_moves) in enumerate(read_games(text.splitlines()), start=1):
+        summary['games'] += 1
+        players = f"{headers.get('White', '?')} - {headers.get('Black', '?')}"
+        state = None
+        try:
+            for _, _, state in replay(headers, san_moves, state_class, claim_draws=False):
+                summary['plies'] += 1
+        except ValueError as error:
+            summary['illegal'] += 1
+            summary['errors'].append((number, players, str(error)))
+            continue
+
+        if state is None:
+            state = start_state(headers, state_class, claim_draws=False)
+        summary['endings'][_ending(state)] += 1
+        result = game_result(state)
+        declared = headers.get('Result', '*')
+        if result != '*' and declared != result:
+            summary['mismatched'] += 1
+            summary['errors'].append((number, players, f"Result {declared} but the game ended {result} "
+                                                       f"by {_ending(state)}"))
+    return summary
+
+
+def validate(path, workers=None, games_per_chunk=500, bitboard=False):
+    """Validate every game of a PGN file and return the merged summary"""
+    workers = workers or os.cpu_count() or 1
+    ranges = chunk_ranges(path, games_per_chunk)
+    total = new_summary()
+    if workers == 1:
+        for start, end in ranges:
+            merge(total, validate_chunk(path, start, end, bitboard))
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(validate_chunk, path, start, end, bitboard) for start, end in ranges]
+        # Merged in file order so game numbers come out right
+        for future in futures:
+            merge(total, future.result())
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check every game of a PGN file against the rules")
+    parser.add_argument('path')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=500, help="games per work unit")
+    parser.add_argument('--bitboard', action='store_true', help="use the bitboard backend")
+    parser.add_argument('--show', type=int, default=20, help="number of problem games to list")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    total = validate(args.path, args.workers, args.chunk, args.bitboard)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    for number, players, message in total['errors'][:args.show]:
+        print(f"Game {number} ({players}): {message}")
+    if len(total['errors']) > args.show:
+        print(f"... and {len(total['errors']) - args.show} more")
+    print(f"{total['games']} games, {total['plies']} plies, {total['illegal']} illegal, "
+          f"{total['mismatched']} with a wrong result")
+    print("Endings: " + ', '.join(f"{ending} {count}" for ending, count in total['endings'].most_common()))
+    print(f"{args.workers} workers, {elapsed:.2f}s ({total['games'] / elapsed:.1f} games/s, "
+          f"{total['plies'] / elapsed:.0f} plies/s)")
+    return 1 if total['illegal'] or total['mismatched'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""Compact, immutable chess positions for storing and cloning in bulk.
+
+A Position keeps only what identifies a position: a 64-byte board, the
+side to move, castling rights as the 4-bit mask of zobrist.castling_rights,
+the en passant target square, the move clocks, the Zobrist key and a
+material signature packed into one integer (4 bits of count per piece).
+There is no move history and no game status, so it is a fraction of the
+size of a GameState. play() returns a new Position and never changes the
+old one, so positions can be shared freely and copy() is one small object.
+
+Positions come from and go back to GameState, which keeps the rules:
+
+    position = Position.from_state(state)
+    state = position.to_state()
+
+    python position.py --count 1000000      # memory per stored position
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+from game_state import GameState, START_FEN, square_name
+from tablebase import signature
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, castling_rights
+
+# Board bytes: 0 for empty, 1-6 for white P N B R Q K, and 8 more for black
+NAMES = ['--'] * 16
+CODES = {'--': 0}
+for _kind_index, _kind in enumerate('PNBRQK', start=1):
+    for _color, _offset in (('w', 0), ('b', 8)):
+        NAMES[_kind_index + _offset] = _color + _kind
+        CODES[_color + _kind] = _kind_index + _offset
+PAWN, KING = 1, 6
+NO_SQUARE = 64  # en_passant when there is no target
+
+# Castling rights lost when a piece leaves or lands on a square, bits K, Q, k, q
+_RIGHTS_LOST = [0] * 64
+_RIGHTS_LOST[60], _RIGHTS_LOST[63], _RIGHTS_LOST[56] = 3, 1, 2
+_RIGHTS_LOST[4], _RIGHTS_LOST[7], _RIGHTS_LOST[0] = 12, 4, 8
+
+
+class Position:
+    __slots__ = ('board', 'white_to_move', 'castling', 'en_passant', 'halfmove_clock', 'fullmove_number',
+                 'material', 'key')
+
+    def __init__(self, board, white_to_move=True, castling=0, en_passant=NO_SQUARE, halfmove_clock=0,
+                 fullmove_number=1):
+        self.board = bytes(board)
+        self.white_to_move = white_to_move
+        self.castling = castling
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        material = 0
+        key = 0 if white_to_move else SIDE_KEY
+        for square, code in enumerate(self.board):
+            if code:
+                material += 1 << 4 * code
+                key ^= PIECE_KEYS[NAMES[code]][square]
+        self.material = material
+        self.key = key ^ CASTLING_KEYS[castling] ^ self._en_passant_key()
+
+    @classmethod
+    def from_state(cls, state):
+        board = bytes(CODES[piece] for row in state.board_state for piece in row)
+        en_passant = NO_SQUARE
+        if state.last_move:
+            start_row, col, end_row = state.last_move[:3]
+            en_passant = (start_row + end_row) // 2 * 8 + col
+        return cls(board, state.white_to_move, castling_rights(state.has_moved), en_passant,
+                   state.halfmove_clock, state.fullmove_number)
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls.from_state(GameState.from_fen(fen))
+
+    def to_state(self, state_class=GameState):
+        """A GameState for this position, with no move history"""
+        return state_class.from_fen(self.to_fen())
+
+    def to_fen(self):
+        ranks = []
+        for row in range(8):
+            rank = ''
+            empty = 0
+            for code in self.board[row * 8:row * 8 + 8]:
+                if not code:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += NAMES[code][1] if code < 8 else NAMES[code][1].lower()
+            ranks.append(rank + (str(empty) if empty else ''))
+        castling = ''.join(symbol for bit, symbol in enumerate('KQkq') if self.castling >> bit & 1) or '-'
+        en_passant = '-' if self.en_passant == NO_SQUARE else square_name(*divmod(self.en_passant, 8))
+        return (f"{'/'.join(ranks)} {'w' if self.white_to_move else 'b'} {castling} {en_passant} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def piece_at(self, row, col):
+        """Piece name on a square, as in GameState.board_state"""
+        return NAMES[self.board[row * 8 + col]]
+
+    def count(self, piece):
+        """Number of pieces of a kind, such as 'wN', read from the material signature"""
+        return self.material >> 4 * CODES[piece] & 15
+
+    def signature(self):
+        """Material signature such as 'KRvKB', as used to name tablebases"""
+        return signature(name for code, name in enumerate(NAMES) if code
+                         for _ in range(self.material >> 4 * code & 15))
+
+    def copy(self):
+        """A new Position sharing this one's board. Positions never change, so this is only needed for identity"""
+        clone = Position.__new__(Position)
+        for name in Position.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
+
+    def _en_passant_key(self):
+        """Zobrist en passant term: the target's file, only when a pawn of the side to move can take"""
+        if self.en_passant == NO_SQUARE:
+            return 0
+        col = self.en_passant & 7
+        # The pawn that moved two squares is just past the target square
+        pawn_square = self.en_passant + (8 if self.white_to_move else -8)
+        capturer = CODES['wP' if self.white_to_move else 'bP']
+        board = self.board
+        if (col > 0 and board[pawn_square - 1] == capturer) or (col < 7 and board[pawn_square + 1] == capturer):
+            return EN_PASSANT_KEYS[col]
+        return 0
+
+    def play(self, move):
+        """The position after a legal move (start_row, start_col, end_row, end_col, promotion)"""
+        start_row, start_col, end_row, end_col, promotion = move
+        start, end = start_row * 8 + start_col, end_row * 8 + end_col
+        board = bytearray(self.board)
+        piece = board[start]
+        kind = piece & 7
+        captured = board[end]
+        capture_square = end
+        key = self.key ^ SIDE_KEY ^ self._en_passant_key()
+        material = self.material
+        halfmove_clock = 0 if kind == PAWN else self.halfmove_clock + 1
+
+        # En passant: a pawn moving diagonally onto an empty square
+        if kind == PAWN and not captured and start_col != end_col:
+            capture_square = start_row * 8 + end_col
+            captured = board[capture_square]
+            board[capture_square] = 0
+        if captured:
+            key ^= PIECE_KEYS[NAMES[captured]][capture_square]
+            material -= 1 << 4 * captured
+            halfmove_clock = 0
+
+        placed = piece
+        if promotion:
+            placed = CODES[NAMES[piece][0] + promotion]
+            material += (1 << 4 * placed) - (1 << 4 * piece)
+        board[start] = 0
+        board[end] = placed
+        key ^= PIECE_KEYS[NAMES[piece]][start] ^ PIECE_KEYS[NAMES[placed]][end]
+
+        # Castling also moves the rook
+        if kind == KING and abs(end_col - start_col) == 2:
+            rook_from, rook_to = (end + 1, end - 1) if end_col == 6 else (end - 2, end + 1)
+            rook = board[rook_from]
+            board[rook_from] = 0
+            board[rook_to] = rook
+            key ^= PIECE_KEYS[NAMES[rook]][rook_from] ^ PIECE_KEYS[NAMES[rook]][rook_to]
+
+        castling = self.castling & ~(_RIGHTS_LOST[start] | _RIGHTS_LOST[end])
+        key ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling]
+
+        position = Position.__new__(Position)
+        position.board = bytes(board)
+        position.white_to_move = not self.white_to_move
+        position.castling = castling
+        position.en_passant = (start + end) // 2 if kind == PAWN and abs(end_row - start_row) == 2 else NO_SQUARE
+        position.halfmove_clock = halfmove_clock
+        position.fullmove_number = self.fullmove_number + (not self.white_to_move)
+        position.material = material
+        position.key = key ^ position._en_passant_key()
+        return position
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.key == other.key and self.board == other.board
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+def random_games(games, seed=1, max_plies=200):
+    """Move lists of random legal games, played on GameState"""
+    rng = random.Random(seed)
+    for _ in range(games):
+        state = GameState()
+        moves = []
+        while len(moves) < max_plies and not state.is_game_over():
+            move = rng.choice(state.generate_legal_moves())
+            state.make_move(*move)
+            moves.append(move)
+        yield moves
+
+
+def memory_report(count, games=50):
+    """Print the memory and clone cost of count stored Positions against GameState copies"""
+    game_moves = list(random_games(games))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    positions = []
+    start = time.perf_counter()
+    while len(positions) < count:
+        for moves in game_moves:
+            position = Position.from_fen(START_FEN)
+            for move in moves[:count - len(positions)]:
+                position = position.play(move)
+                positions.append(position)
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(positions)
+
+    # GameState copies are much bigger, so measure a sample and scale it up
+    state = GameState()
+    for move in game_moves[0][:40]:
+        state.make_move(*move)
+    sample = 1000
+    before = tracemalloc.get_traced_memory()[0]
+    copies = [deepcopy(state) for _ in range(sample)]
+    state_bytes = (tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(copies)) / sample
+    tracemalloc.stop()
+
+    position = positions[len(positions) // 2]
+    clone_start = time.perf_counter()
+    for _ in range(100000):
+        position.copy()
+    clone_time = (time.perf_counter() - clone_start) / 100000
+    copy_start = time.perf_counter()
+    for _ in range(200):
+        deepcopy(state)
+    copy_time = (time.perf_counter() - copy_start) / 200
+
+    per_position = used / count
+    print(f"{count} positions in {used / 1024 / 1024:.1f} MB: {per_position:.0f} bytes each "
+          f"(object {sys.getsizeof(position)}, board {sys.getsizeof(position.board)}), "
+          f"built in {elapsed:.1f}s")
+    print(f"GameState after 40 plies: {state_bytes:.0f} bytes each, {state_bytes * count / 1024 / 1024:.0f} MB "
+          f"for {count}")
+    print(f"clone: Position.copy {clone_time * 1e6:.2f} us, deepcopy(GameState) {copy_time * 1e6:.0f} us")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the memory of stored positions")
+    parser.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args(argv)
+    memory_report(args.count)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""Opt-in counters and timers for move generation, search and board drawing.
+
+Nothing is measured until Profiler.enable() is called. It swaps timing
+wrappers in for the rules methods (get_valid_moves_for_piece,
+is_under_attack, can_castle), Searcher.search and the deepcopy that takes
+game snapshots; disable() puts the originals back. A program that never
+enables it runs the untouched code and pays nothing. Anything else,
+such as ChessBoard.draw_board, can be timed with wrap().
+
+Each wrapped function gets a call count and total time, nested calls
+included. Moves (make_move and promote) and frames (frame_done, called
+by the front end) are also recorded in histograms: the time of the whole
+move, and the time and number of rules calls made during it. Only the
+outermost of nested rules calls adds to a move's generation time.
+
+Transposition tables handed to add_table() are reported alongside, with
+their probes, hit rate and fill. Results are written as JSON or
+Prometheus text:
+
+    python profiler.py --games 20 --depth 2 --out profile.prom
+    python interface.py --profile profile.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+import pgn
+import worker
+from bitboard import BitboardGameState
+from game_state import GameState
+from search import Searcher
+
+# Histogram upper bounds: seconds, from 10 us to 1 s, and calls per move
+SECONDS_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0)
+CALLS_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000)
+
+# Methods counted as move generation, on every class that defines its own
+RULES = ('get_valid_moves_for_piece', 'is_under_attack', 'can_castle')
+
+_MISSING = object()  # Marks an attribute that was inherited rather than set on the owner itself
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last one is above every bound
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, ending with infinity"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': {str(bound): total for bound, total in self.cumulative()}}
+
+
+class Profiler:
+    def __init__(self):
+        self.calls = {}  # Function name -> [calls, seconds]
+        self.histograms = {
+            'frame_seconds': Histogram(SECONDS_BUCKETS),
+            'move_seconds': Histogram(SECONDS_BUCKETS),
+            'move_generation_seconds': Histogram(SECONDS_BUCKETS),
+            'move_generation_calls': Histogram(CALLS_BUCKETS),
+        }
+        self.last_move = None  # (seconds, generation seconds, generation calls) of the latest move
+        self.tables = {}  # Name -> TranspositionTable to report on
+        self.enabled = False
+        self._patched = []  # (owner, name, what owner.__dict__ held before) in the order wrapped
+        # Rules call nesting and totals are kept per thread, as the computer searches on a worker thread
+        self._local = threading.local()
+
+    def _thread(self):
+        local = self._local
+        if not hasattr(local, 'depth'):
+            local.depth = 0
+            local.generation_seconds = 0
+            local.generation_calls = 0
+            local.in_move = False
+        return local
+
+    def wrap(self, owner, name, rules=False):
+        """Replace owner.name, a class, instance or module attribute, with a timed version until disable()"""
+        function = getattr(owner, name)
+        label = f"{getattr(owner, '__name__', type(owner).__name__)}.{name}"
+        stat = self.calls.setdefault(label, [0, 0])
+        perf_counter = time.perf_counter
+        thread = self._thread
+
+        if rules:
+            def timed(*args, **kwargs):
+                local = thread()
+                depth = local.depth
+                local.depth = depth + 1
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    elapsed = perf_counter() - start
+                    local.depth = depth
+                    # Counters may lose the odd update while the UI and a search thread both run
+                    stat[0] += 1
+                    stat[1] += elapsed
+                    local.generation_calls += 1
+                    if not depth:
+                        local.generation_seconds += elapsed
+        else:
+            def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    stat[0] += 1
+                    stat[1] += perf_counter() - start
+
+        self._patched.append((owner, name, vars(owner).get(name, _MISSING)))
+        setattr(owner, name, timed)
+
+    def _wrap_move(self, cls, name):
+        """Time a game-level move and the rules calls made during it"""
+        function = getattr(cls, name)
+        perf_counter = time.perf_counter
+        histograms = self.histograms
+        thread = self._thread
+
+        def timed(*args, **kwargs):
+            local = thread()
+            if local.in_move:
+                # An override calling the base class: the outer call records the move
+                return function(*args, **kwargs)
+            seconds, calls = local.generation_seconds, local.generation_calls
+            local.in_move = True
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                local.in_move = False
+                seconds = local.generation_seconds - seconds
+                calls = local.generation_calls - calls
+                histograms['move_seconds'].observe(elapsed)
+                histograms['move_generation_seconds'].observe(seconds)
+                histograms['move_generation_calls'].observe(calls)
+                self.last_move = (elapsed, seconds, calls)
+
+        self._patched.append((cls, name, vars(cls).get(name, _MISSING)))
+        setattr(cls, name, timed)
+
+    def enable(self):
+        """Start timing the rules, the search and game snapshots"""
+        if self.enabled:
+            return self
+        self.enabled = True
+        for cls in (GameState, BitboardGameState):
+            for name in RULES:
+                if name in vars(cls):
+                    self.wrap(cls, name, rules=True)
+        for cls in (GameState, BitboardGameState):
+            for name in ('make_move', 'promote'):
+                if name in vars(cls):
+                    self._wrap_move(cls, name)
+        self.wrap(Searcher, 'search')
+        # Snapshots for the search thread and for writing PGN
+        self.wrap(worker, 'deepcopy')
+        self.wrap(pgn, 'deepcopy')
+        return self
+
+    def disable(self):
+        """Put back everything wrapped, leaving the numbers gathered so far"""
+        for owner, name, original in reversed(self._patched):
+            if original is _MISSING:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patched = []
+        self.enabled = False
+
+    def add_table(self, name, table):
+        """Report on a search's transposition table, None for a search without one"""
+        if table is not None:
+            self.tables[name] = table
+
+    def frame_done(self, seconds):
+        """Record the time a front end spent on one frame"""
+        self.histograms['frame_seconds'].observe(seconds)
+
+    def snapshot(self):
+        return {
+            'calls': {label: {'count': count, 'seconds': seconds}
+                      for label, (count, seconds) in sorted(self.calls.items())},
+            'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            'last_move': dict(zip(('seconds', 'generation_seconds', 'generation_calls'), self.last_move))
+            if self.last_move else None,
+            'tables': {name: {'size_mb': table.size_mb, 'probes': table.probes, 'hits': table.hits,
+                              'stores': table.stores, 'hit_rate': table.hit_rate(), 'fill_rate': table.fill_rate()}
+                       for name, table in sorted(self.tables.items())},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The numbers in the Prometheus text exposition format"""
+        lines = ['# HELP chess_calls_total Calls to an instrumented function.',
+                 '# TYPE chess_calls_total counter']
+        for label, (count, _) in sorted(self.calls.items()):
+            lines.append(f'chess_calls_total{{function="{label}"}} {count}')
+        lines += ['# HELP chess_call_seconds_total Time spent in an instrumented function, nested calls included.',
+                  '# TYPE chess_call_seconds_total counter']
+        for label, (_, seconds) in sorted(self.calls.items()):
+            lines.append(f'chess_call_seconds_total{{function="{label}"}} {seconds:.9f}')
+        for name, histogram in self.histograms.items():
+            metric = 'chess_' + name
+            lines.append(f'# TYPE {metric} histogram')
+            for bound, total in histogram.cumulative():
+                lines.append(f'{metric}_bucket{{le="{"+Inf" if bound == float("inf") else bound}"}} {total}')
+            lines.append(f'{metric}_sum {histogram.sum}')
+            lines.append(f'{metric}_count {histogram.count}')
+        if self.tables:
+            tables = sorted(self.tables.items())
+            for metric, kind, read in (('chess_tt_probes_total', 'counter', lambda table: table.probes),
+                                       ('chess_tt_hits_total', 'counter', lambda table: table.hits),
+                                       ('chess_tt_stores_total', 'counter', lambda table: table.stores),
+                                       ('chess_tt_fill_ratio', 'gauge', lambda table: table.fill_rate())):
+                lines.append(f'# TYPE {metric} {kind}')
+                for name, table in tables:
+                    lines.append(f'{metric}{{table="{name}"}} {read(table)}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Save to a file: Prometheus text for .prom or .txt, JSON otherwise"""
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        with open(path, 'w') as out:
+            out.write(text)
+
+    def summary(self):
+        """Calls and time per function, busiest first"""
+        lines = []
+        for label, (count, seconds) in sorted(self.calls.items(), key=lambda item: -item[1][1]):
+            if count:
+                lines.append(f"{label:40} {count:9} calls {seconds:9.3f}s {seconds / count * 1e6:9.2f} us/call")
+        moves = self.histograms['move_generation_seconds']
+        if moves.count:
+            calls = self.histograms['move_generation_calls']
+            lines.append(f"{moves.count} moves: {moves.sum / moves.count * 1000:.3f} ms and "
+                         f"{calls.sum / calls.count:.0f} rules calls of move generation each")
+        for name, table in sorted(self.tables.items()):
+            lines.append(f"{name}: {table.stats()}")
+        return '\n'.join(lines)
+
+
+def play_games(games, depth, seed=1, state_class=GameState, max_plies=200, searcher=None):
+    """Random games with a shallow search of every position, as a workload to profile"""
+    rng = random.Random(seed)
+    searcher = searcher or Searcher(max_depth=depth, tt_size_mb=4)
+    for _ in range(games):
+        state = state_class()
+        while len(state.move_stack) < max_plies and not state.is_game_over():
+            if depth:
+                searcher.search(state)
+            state.make_move(*rng.choice(state.generate_legal_moves()))
+        # As when a game is saved
+        pgn.write_pgn(state)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile move generation and search over random games")
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=1, help="search depth at every position, 0 for none")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bitboard', action='store_true', help="use the bitboard backend")
+    parser.add_argument('--out', help="write the results here: .prom or .txt for Prometheus text, else JSON")
+    args = parser.parse_args(argv)
+    state_class = BitboardGameState if args.bitboard else GameState
+
+    start = time.perf_counter()
+    play_games(args.games, args.depth, args.seed, state_class)
+    plain = time.perf_counter() - start
+
+    profiler = Profiler().enable()
+    searcher = Searcher(max_depth=args.depth, tt_size_mb=4)
+    profiler.add_table('search', searcher.tt)
+    start = time.perf_counter()
+    try:
+        play_games(args.games, args.depth, args.seed, state_class, searcher=searcher)
+    finally:
+        profiler.disable()
+    profiled = time.perf_counter() - start
+
+    print(profiler.summary())
+    print(f"{plain:.2f}s without instrumentation, {profiled:.2f}s with it")
+    if args.out:
+        profiler.write(args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
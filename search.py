@@ -0,0 +1,384 @@
+"""Computer opponent: negamax alpha-beta search with iterative deepening over GameState.
+
+Moves are played with GameState.push_move/pop_move, so the search never
+copies the board. Scores are in centipawns from the side to move's view.
+"""
+
+import time
+
+from tablebase import DRAW, LOSS
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+PIECE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+# Piece-square tables from white's side, row 0 being the 8th rank as in board_state
+PIECE_SQUARE_TABLES = {
+    'P': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [50, 50, 50, 50, 50, 50, 50, 50],
+        [10, 10, 20, 30, 30, 20, 10, 10],
+        [5, 5, 10, 25, 25, 10, 5, 5],
+        [0, 0, 0, 20, 20, 0, 0, 0],
+        [5, -5, -10, 0, 0, -10, -5, 5],
+        [5, 10, 10, -20, -20, 10, 10, 5],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+    'N': [
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+        [-40, -20, 0, 0, 0, 0, -20, -40],
+        [-30, 0, 10, 15, 15, 10, 0, -30],
+        [-30, 5, 15, 20, 20, 15, 5, -30],
+        [-30, 0, 15, 20, 20, 15, 0, -30],
+        [-30, 5, 10, 15, 15, 10, 5, -30],
+        [-40, -20, 0, 5, 5, 0, -20, -40],
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+    ],
+    'B': [
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 10, 10, 5, 0, -10],
+        [-10, 5, 5, 10, 10, 5, 5, -10],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-10, 10, 10, 10, 10, 10, 10, -10],
+        [-10, 5, 0, 0, 0, 0, 5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+    ],
+    'R': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [5, 10, 10, 10, 10, 10, 10, 5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [0, 0, 0, 5, 5, 0, 0, 0],
+    ],
+    'Q': [
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 5, 5, 5, 0, -10],
+        [-5, 0, 5, 5, 5, 5, 0, -5],
+        [0, 0, 5, 5, 5, 5, 0, -5],
+        [-10, 5, 5, 5, 5, 5, 0, -10],
+        [-10, 0, 5, 0, 0, 0, 0, -10],
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+    ],
+    'K': [
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-20, -30, -30, -40, -40, -30, -30, -20],
+        [-10, -20, -20, -20, -20, -20, -20, -10],
+        [20, 20, 0, 0, 0, 0, 20, 20],
+        [20, 30, 10, 0, 0, 10, 30, 20],
+    ],
+}
+
+
+def _square_scores():
+    """Material plus placement per piece and square, positive for white and negative for black"""
+    scores = {}
+    for kind, table in PIECE_SQUARE_TABLES.items():
+        scores['w' + kind] = [PIECE_VALUES[kind] + table[row][col] for row in range(8) for col in range(8)]
+        scores['b' + kind] = [-(PIECE_VALUES[kind] + table[7 - row][col]) for row in range(8) for col in range(8)]
+    return scores
+
+
+SQUARE_SCORES = _square_scores()
+MATE_SCORE = 100000
+MAX_PLY = 128
+
+
+def evaluate(state):
+    """Static evaluation of a position from the side to move's view"""
+    score = 0
+    index = 0
+    for row in state.board_state:
+        for piece in row:
+            if piece != '--':
+                score += SQUARE_SCORES[piece][index]
+            index += 1
+    return score if state.white_to_move else -score
+
+
+def _score_to_table(score, ply):
+    """Mate scores are stored as distance from the stored node rather than from the root"""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def _tablebase_score(value, ply):
+    """Search score for a tablebase value: a draw, or a mate the given number of moves away"""
+    if value == DRAW:
+        return 0
+    if value < LOSS:
+        return MATE_SCORE - ply - (2 * value - 1)
+    return -MATE_SCORE + ply + 2 * (value - LOSS)
+
+
+class Searcher:
+    def __init__(self, max_depth=64, time_limit=None, node_limit=None, tt_size_mb=16, on_iteration=None,
+                 book=None, tablebase=None):
+        self.max_depth = max_depth
+        self.time_limit = time_limit  # Seconds per move, None for no limit
+        self.node_limit = node_limit  # Nodes per move, None for no limit
+        # Called as on_iteration(depth, score, best_move, nodes) after each completed depth
+        self.on_iteration = on_iteration
+        # Kept between moves, so later searches reuse earlier results
+        self.tt = TranspositionTable(tt_size_mb) if tt_size_mb else None
+        # OpeningBook played from before searching, None to always search
+        self.book = book
+        # Tablebases for exact results once few pieces are left, None to always search
+        self.tablebase = tablebase
+
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+        self.from_book = False
+        self.from_tablebase = False
+        self.stopped = False
+        self.stop_requested = False
+        self._deadline = None
+        self._killers = [[None, None] for _ in range(MAX_PLY)]
+        self._history = {}
+        self._path = []
+
+    def search(self, state, root_moves=None):
+        """Find the best move for the side to move, or None if there is no legal move.
+
+        root_moves limits the search to some of the legal moves, as when
+        the root is split between several searchers. Otherwise a book move
+        is played without searching when the position is in the book, and
+        the tablebase move when the tables cover the position.
+        """
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+        self.from_book = False
+        self.from_tablebase = False
+        self.stopped = False
+        self._deadline = time.perf_counter() + self.time_limit if self.time_limit else None
+        self._killers = [[None, None] for _ in range(MAX_PLY)]
+        self._history = {}
+        self._path = []
+        if self.tt is not None:
+            self.tt.new_search()
+
+        if self.book is not None and root_moves is None:
+            self.best_move = self.book.choose(state)
+            if self.best_move is not None:
+                self.from_book = True
+                self.stop_requested = False
+                return self.best_move
+        if self.tablebase is not None and root_moves is None:
+            found = self.tablebase.best_move(state)
+            if found is not None:
+                self.best_move = found[0]
+                self.score = _tablebase_score(found[1], 0)
+                self.from_tablebase = True
+                self.stop_requested = False
+                return self.best_move
+
+        root_moves = list(root_moves) if root_moves is not None else state.generate_legal_moves()
+        if not root_moves:
+            return None
+        self.best_move = root_moves[0]
+
+        for depth in range(1, self.max_depth + 1):
+            score, move = self._search_root(state, root_moves, depth)
+            if move is not None:
+                self.best_move = move
+                self.score = score
+                self.depth = depth
+            if not self.stopped and self.on_iteration is not None:
+                self.on_iteration(depth, self.score, self.best_move, self.nodes)
+            if self.stopped or abs(self.score) >= MATE_SCORE - MAX_PLY:
+                break
+            # Search the best move first on the next iteration
+            root_moves.remove(self.best_move)
+            root_moves.insert(0, self.best_move)
+
+        self.stop_requested = False
+        return self.best_move
+
+    def stop(self):
+        """Ask a running search to finish now with the best move found so far. Safe to call from another thread"""
+        self.stop_requested = True
+
+    def _search_root(self, state, moves, depth):
+        alpha = -MATE_SCORE - 1
+        best_move = None
+        self._path.append(state.zobrist_key)
+        for move in moves:
+            undo = state.push_move(*move)
+            score = -self._negamax(state, depth - 1, -MATE_SCORE - 1, -alpha, 1)
+            state.pop_move(undo)
+            if self.stopped:
+                break
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self._path.pop()
+        if best_move is not None and not self.stopped and self.tt is not None:
+            self.tt.store(state.zobrist_key, depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _check_limits(self):
+        if self.stop_requested:
+            self.stopped = True
+        elif self.node_limit is not None and self.nodes >= self.node_limit:
+            self.stopped = True
+        elif self._deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() >= self._deadline:
+            self.stopped = True
+
+    def _is_repetition(self, state):
+        key = state.zobrist_key
+        return key in self._path or key in state.position_counts
+
+    def _negamax(self, state, depth, alpha, beta, ply):
+        self.nodes += 1
+        self._check_limits()
+        if self.stopped:
+            return 0
+
+        if self._is_repetition(state) or state.halfmove_clock >= 100:
+            return 0
+
+        if self.tablebase is not None and state.piece_count <= self.tablebase.max_pieces:
+            value = self.tablebase.probe(state)
+            if value is not None:
+                return _tablebase_score(value, ply)
+
+        king_pos = state.find_king(state.white_to_move)
+        in_check = state.is_under_attack(king_pos[0], king_pos[1], state.white_to_move)
+        if in_check and depth <= 0:
+            depth = 1  # Never stand pat in check at the horizon
+
+        if depth <= 0:
+            return self._quiescence(state, alpha, beta, ply)
+
+        # A stored result from at least this depth may settle the node outright
+        tt_move = None
+        if self.tt is not None:
+            entry = self.tt.probe(state.zobrist_key)
+            if entry is not None:
+                entry_depth, score, bound, tt_move = entry
+                if entry_depth >= depth:
+                    score = _score_from_table(score, ply)
+                    if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                        return score
+
+        moves = state.generate_legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        self._path.append(state.zobrist_key)
+        original_alpha = alpha
+        best = -MATE_SCORE - 1
+        best_move = None
+        for move in self._order_moves(state, moves, ply, tt_move):
+            undo = state.push_move(*move)
+            score = -self._negamax(state, depth - 1, -beta, -alpha, ply + 1)
+            state.pop_move(undo)
+            if self.stopped:
+                break
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if state.board_state[move[2]][move[3]] == '--':
+                            self._record_quiet_cutoff(state, move, depth, ply)
+                        break
+        self._path.pop()
+
+        if not self.stopped and self.tt is not None:
+            if best >= beta:
+                bound = LOWER
+            elif best > original_alpha:
+                bound = EXACT
+            else:
+                bound = UPPER
+            self.tt.store(state.zobrist_key, depth, _score_to_table(best, ply), bound, best_move)
+        return best
+
+    def _quiescence(self, state, alpha, beta, ply):
+        """Search captures only until the position is quiet, so the evaluation is not taken mid-exchange"""
+        self.nodes += 1
+        self._check_limits()
+        if self.stopped:
+            return 0
+
+        stand_pat = evaluate(state)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        if ply >= MAX_PLY - 1:
+            return stand_pat
+
+        board = state.board_state
+        captures = [move for move in state.generate_legal_moves()
+                    if board[move[2]][move[3]] != '--' or move[4] == 'Q'
+                    or (board[move[0]][move[1]][1] == 'P' and move[1] != move[3])]
+        for move in self._order_moves(state, captures, ply):
+            undo = state.push_move(*move)
+            score = -self._quiescence(state, -beta, -alpha, ply + 1)
+            state.pop_move(undo)
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order_moves(self, state, moves, ply, tt_move=None):
+        """The table move, then captures by most valuable victim and least valuable attacker, then killers and history"""
+        board = state.board_state
+        killers = self._killers[ply]
+        history = self._history
+
+        def priority(move):
+            if move == tt_move:
+                return 2000000
+            start_row, start_col, end_row, end_col, promotion = move
+            piece = board[start_row][start_col]
+            victim = board[end_row][end_col]
+            if victim != '--':
+                return 1000000 + PIECE_VALUES[victim[1]] * 10 - PIECE_VALUES[piece[1]] // 10
+            if promotion:
+                return 900000 + PIECE_VALUES[promotion]
+            if piece[1] == 'P' and start_col != end_col:
+                return 1000000 + PIECE_VALUES['P'] * 10 - PIECE_VALUES['P'] // 10
+            if move == killers[0]:
+                return 800000
+            if move == killers[1]:
+                return 790000
+            return history.get((piece, end_row, end_col), 0)
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def _record_quiet_cutoff(self, state, move, depth, ply):
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        piece = state.board_state[move[0]][move[1]]
+        key = (piece, move[2], move[3])
+        self._history[key] = self._history.get(key, 0) + depth * depth
@@ -0,0 +1,301 @@
+"""Asyncio game server: thousands of headless games in one process over a line-based TCP protocol.
+
+Each game is a GameState. Moves are checked with get_valid_moves_for_piece
+and played with make_move, and promote() finishes a promotion sent
+without its piece. After every move, the players and watchers of the game
+are sent an update line.
+
+Commands, one per line, are answered with 'ok ...' or 'error <reason>':
+
+    new [FEN]                 start a game playing white     -> ok new <game>
+    join <game>               play black                     -> ok join <game> <status> <fen>
+    watch <game>              get the game's updates         -> ok watch <game> <status> <fen>
+    move <game> <move>        coordinate notation, e2e4 or e7e8q
+    promote <game> <piece>    Q, R, B or N for a pawn moved without one
+    state <game>              -> ok state <game> <status> <fen>
+    memory <game>             -> ok memory <game> <bytes>
+    leave <game>              stop playing or watching       -> ok leave <game>
+    stats                     -> ok stats games=... clients=... moves=... bytes=... max_bytes=...
+    quit
+
+A move is answered by its update, 'update <game> <move> <status> <fen>',
+which also goes to everyone else in the game. Status is one of playing,
+check, promotion, checkmate, stalemate, insufficient, repetition or
+fifty-move. A game is dropped once nobody is left in it. A command that
+fails for any reason gets an error reply and the connection stays open.
+
+    python server.py --port 8765
+"""
+
+import argparse
+import asyncio
+import sys
+
+from game_state import GameState, move_name, parse_square
+
+
+class Game:
+    def __init__(self, game_id, state):
+        self.id = game_id
+        self.state = state
+        self.players = {'w': None, 'b': None}  # Client playing each colour
+        self.watchers = set()
+
+    def clients(self):
+        return {client for client in self.players.values() if client is not None} | self.watchers
+
+
+class Client:
+    """One connection: where to send lines, and the games it takes part in"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.games = set()
+
+    def send(self, line):
+        # Buffered by the transport; the connection's own loop drains it
+        self.writer.write(line.encode() + b'\n')
+
+
+def game_status(state):
+    if state.awaiting_promotion:
+        return 'promotion'
+    if state.checkmate:
+        return 'checkmate'
+    if state.stalemate:
+        return 'stalemate'
+    if state.insufficient:
+        return 'insufficient'
+    if state.repetition:
+        return 'repetition'
+    if state.fifty_move:
+        return 'fifty-move'
+    return 'check' if state.in_check else 'playing'
+
+
+def position_error(state):
+    """Why a position loaded from a FEN cannot be played, or None if it can"""
+    for color, name in (('w', 'white'), ('b', 'black')):
+        if state.pieces_left[color + 'K'] != 1:
+            return f"{name} needs exactly one king"
+    if any(piece[1] == 'P' for piece in state.board_state[0] + state.board_state[7] if piece != '--'):
+        return "pawn on the first or last rank"
+    # The side that just moved cannot have left its king attacked
+    king = state.find_king(not state.white_to_move)
+    if state.is_under_attack(king[0], king[1], not state.white_to_move):
+        return "the side not to move is in check"
+    return None
+
+
+async def read_line(reader):
+    """Next line, b'' at the end of the stream, or None for a line over the stream limit, skipped whole"""
+    too_long = False
+    while True:
+        try:
+            line = await reader.readuntil(b'\n')
+            return None if too_long else line
+        except asyncio.IncompleteReadError as error:
+            return b'' if too_long else error.partial
+        except asyncio.LimitOverrunError as error:
+            # Drop what is buffered and keep reading to the end of the line
+            too_long = True
+            await reader.readexactly(error.consumed)
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by an object and everything it refers to, each object counted once.
+
+    Strings are left out: the board only holds the shared piece names.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, str):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+class GameServer:
+    def __init__(self):
+        self.games = {}
+        self.clients = set()
+        self.next_id = 1
+        self.moves = 0
+
+    async def handle(self, reader, writer):
+        client = Client(writer)
+        self.clients.add(client)
+        try:
+            while True:
+                line = await read_line(reader)
+                if line is None:
+                    client.send("error line too long")
+                    await writer.drain()
+                    continue
+                if not line:
+                    break
+                try:
+                    reply = self.command(client, line.decode(errors='replace').split())
+                except Exception as error:
+                    # A bug in the rules must not take the session down with it
+                    reply = f"error internal: {type(error).__name__}: {' '.join(str(error).split())}"
+                if reply is None:
+                    break
+                if reply:
+                    client.send(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.disconnect(client)
+            writer.close()
+
+    def disconnect(self, client):
+        self.clients.discard(client)
+        for game_id in list(client.games):
+            self.leave(client, game_id)
+
+    def leave(self, client, game_id):
+        client.games.discard(game_id)
+        game = self.games.get(game_id)
+        if game is None:
+            return
+        for color, player in game.players.items():
+            if player is client:
+                game.players[color] = None
+        game.watchers.discard(client)
+        if not game.clients():
+            del self.games[game_id]
+
+    def command(self, client, words):
+        """Run one command and return the reply line, '' when the reply went out as an update, None to hang up"""
+        if not words:
+            return ''
+        name, args = words[0].lower(), words[1:]
+        if name == 'quit':
+            return None
+        if name == 'new':
+            try:
+                state = GameState.from_fen(' '.join(args)) if args else GameState()
+            except (ValueError, IndexError) as error:
+                return f"error bad FEN: {error}"
+            problem = position_error(state)
+            if problem:
+                return f"error bad FEN: {problem}"
+            game = Game(self.next_id, state)
+            self.next_id += 1
+            game.players['w'] = client
+            self.games[game.id] = game
+            client.games.add(game.id)
+            return f"ok new {game.id}"
+        if name == 'stats':
+            sizes = [deep_size(game.state) for game in self.games.values()]
+            return (f"ok stats games={len(self.games)} clients={len(self.clients)} moves={self.moves} "
+                    f"bytes={sum(sizes)} max_bytes={max(sizes, default=0)}")
+
+        if not args or not args[0].isdigit() or int(args[0]) not in self.games:
+            return "error no such game"
+        game = self.games[int(args[0])]
+        state = game.state
+        if name == 'join':
+            if game.players['b'] is not None:
+                return f"error game {game.id} is full"
+            game.players['b'] = client
+            client.games.add(game.id)
+            return f"ok join {game.id} {game_status(state)} {state.to_fen()}"
+        if name == 'watch':
+            game.watchers.add(client)
+            client.games.add(game.id)
+            return f"ok watch {game.id} {game_status(state)} {state.to_fen()}"
+        if name == 'state':
+            return f"ok state {game.id} {game_status(state)} {state.to_fen()}"
+        if name == 'memory':
+            return f"ok memory {game.id} {deep_size(state)}"
+        if name == 'leave':
+            self.leave(client, game.id)
+            return f"ok leave {game.id}"
+        if name in ('move', 'promote'):
+            if len(args) != 2:
+                return f"error usage: {name} <game> <{'move' if name == 'move' else 'piece'}>"
+            if game.players['w' if state.white_to_move else 'b'] is not client:
+                return "error not your turn"
+            error = self.move(game, args[1]) if name == 'move' else self.promote(game, args[1])
+            return error or ''
+        return f"error unknown command {name!r}"
+
+    def move(self, game, text):
+        """Validate and play a move, then send the update. Returns an error reply or None"""
+        state = game.state
+        if state.is_game_over():
+            return "error game over"
+        if state.awaiting_promotion:
+            return "error promotion pending"
+        try:
+            start_row, start_col = parse_square(text[0:2])
+            end_row, end_col = parse_square(text[2:4])
+            if not (0 <= start_row < 8 and 0 <= end_row < 8) or len(text) > 5:
+                raise ValueError
+        except (ValueError, IndexError):
+            return f"error bad move {text!r}"
+        promotion = text[4:].upper() or None
+        piece = state.board_state[start_row][start_col]
+        if piece[0] != ('w' if state.white_to_move else 'b'):
+            return f"error illegal move {text}"
+        if promotion is not None and (promotion not in 'QRBN' or piece[1] != 'P' or end_row not in (0, 7)):
+            return f"error illegal move {text}"
+        if (end_row, end_col) not in state.get_valid_moves_for_piece(start_row, start_col):
+            return f"error illegal move {text}"
+
+        state.make_move(start_row, start_col, end_row, end_col, promotion)
+        self.moves += 1
+        self.broadcast(game, move_name((start_row, start_col, end_row, end_col, promotion)))
+        return None
+
+    def promote(self, game, piece):
+        piece = piece.upper()
+        if not game.state.awaiting_promotion:
+            return "error no promotion pending"
+        if piece not in ('Q', 'R', 'B', 'N'):
+            return f"error bad promotion piece {piece!r}"
+        game.state.promote(piece)
+        self.broadcast(game, '=' + piece)
+        return None
+
+    def broadcast(self, game, move_text):
+        state = game.state
+        line = f"update {game.id} {move_text} {game_status(state)} {state.to_fen()}"
+        for client in game.clients():
+            client.send(line)
+
+
+async def serve(host='127.0.0.1', port=8765):
+    server = GameServer()
+    listener = await asyncio.start_server(server.handle, host, port, limit=1 << 16)
+    address = listener.sockets[0].getsockname()
+    # The load client reads this line to find a server it started on port 0
+    print(f"listening on {address[0]}:{address[1]}", flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host chess games over TCP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help="0 picks a free port")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
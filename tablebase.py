@@ -0,0 +1,488 @@
+"""Endgame tablebases: exact results for positions with few pieces, found by retrograde analysis.
+
+A table covers one material balance, such as KQvK or KRvKB, with one byte
+per (side to move, square of each piece) combination:
+
+    0          draw
+    1..126     the side to move mates in that many moves
+    128 + n    the side to move is mated in n moves (128 is checkmate)
+    255        impossible position
+
+Tables are written as raw files named after the material (KQvK.tb) and
+read through mmap, so probing touches only the pages it needs. They
+assume no castling rights and no en passant capture; probe() declines
+such positions. Only the stronger side's orientation is stored; the other
+is probed by mirroring the board and swapping colours.
+
+Generation is pure Python: a three-piece table takes about ten seconds and
+a four-piece one, 64 times larger, around twenty minutes and 200MB.
+
+    python tablebase.py generate KQvK KRvK KPvK
+    python tablebase.py probe "8/8/8/4k3/8/8/8/4K2Q w - - 0 1"
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from game_state import GameState
+from zobrist import castling_rights, en_passant_file
+
+DRAW = 0
+LOSS = 128
+INVALID = 255
+
+DIRECTORY = 'tablebases'
+ORDER = 'KQRBNP'
+_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+
+# Generation works on squares 0-63 (row * 8 + col, row 0 being rank 8) with precomputed geometry
+_ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+_BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def _steps(square, offsets):
+    row, col = divmod(square, 8)
+    return [(row + dr) * 8 + col + dc for dr, dc in offsets if 0 <= row + dr < 8 and 0 <= col + dc < 8]
+
+
+def _ray(square, direction):
+    row, col = divmod(square, 8)
+    squares = []
+    row, col = row + direction[0], col + direction[1]
+    while 0 <= row < 8 and 0 <= col < 8:
+        squares.append(row * 8 + col)
+        row, col = row + direction[0], col + direction[1]
+    return squares
+
+
+KNIGHT = [_steps(square, [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+          for square in range(64)]
+KING = [_steps(square, _ROOK_DIRECTIONS + _BISHOP_DIRECTIONS) for square in range(64)]
+RAYS = {
+    'R': [[_ray(square, direction) for direction in _ROOK_DIRECTIONS] for square in range(64)],
+    'B': [[_ray(square, direction) for direction in _BISHOP_DIRECTIONS] for square in range(64)],
+}
+RAYS['Q'] = [RAYS['R'][square] + RAYS['B'][square] for square in range(64)]
+PAWN_ATTACKS = {'w': [_steps(square, [(-1, -1), (-1, 1)]) for square in range(64)],
+                'b': [_steps(square, [(1, -1), (1, 1)]) for square in range(64)]}
+
+
+def _line(kinds):
+    """For each pair of squares on a common line of the given kind, the squares strictly between them"""
+    between = [dict() for _ in range(64)]
+    for square in range(64):
+        for ray in RAYS[kinds][square]:
+            for distance, target in enumerate(ray):
+                between[square][target] = ray[:distance]
+    return between
+
+
+BETWEEN = {'R': _line('R'), 'B': _line('B')}
+
+
+def _attacks(kind, color, square, target, occupied):
+    if kind == 'K':
+        return target in KING[square]
+    if kind == 'N':
+        return target in KNIGHT[square]
+    if kind == 'P':
+        return target in PAWN_ATTACKS[color][square]
+    for line in ('R', 'B') if kind == 'Q' else (kind,):
+        path = BETWEEN[line][square].get(target)
+        if path is not None and not any(between in occupied for between in path):
+            return True
+    return False
+
+
+def signature(pieces):
+    """Material signature such as 'KRvKB' for an iterable of pieces like 'wK', 'bB'"""
+    pieces = list(pieces)
+    sides = [''.join(sorted((piece[1] for piece in pieces if piece[0] == color), key=ORDER.index))
+             for color in 'wb']
+    return 'v'.join(sides)
+
+
+def flipped(material):
+    white, black = material.split('v')
+    return black + 'v' + white
+
+
+def canonical(material):
+    """The orientation a table is stored in: the side with more material as white"""
+    other = flipped(material)
+    strength = lambda text: (sum(_VALUES[kind] for kind in text.split('v')[0]), text)
+    return max(material, other, key=strength)
+
+
+def piece_list(material):
+    """Pieces of a signature in table order: 'KQvK' -> ['wK', 'wQ', 'bK']"""
+    white, black = material.split('v')
+    return ['w' + kind for kind in white] + ['b' + kind for kind in black]
+
+
+def table_size(material):
+    return 2 * 64 ** len(piece_list(material))
+
+
+def index(placement, white_to_move):
+    """Table index of squares given in table order"""
+    position = 0 if white_to_move else 1
+    for square in reversed(placement):
+        position = position * 64 + square
+    return position
+
+
+def _successors(material):
+    """Signatures reachable by a capture or a promotion"""
+    pieces = piece_list(material)
+    found = set()
+    for removed in range(len(pieces)):
+        if pieces[removed][1] != 'K':
+            found.add(signature(pieces[:removed] + pieces[removed + 1:]))
+    for pawn, piece in enumerate(pieces):
+        if piece[1] != 'P':
+            continue
+        for kind in 'QRBN':
+            promoted = pieces[:pawn] + [piece[0] + kind] + pieces[pawn + 1:]
+            found.add(signature(promoted))
+            for removed in range(len(promoted)):
+                if promoted[removed][0] != piece[0] and promoted[removed][1] != 'K':
+                    found.add(signature(promoted[:removed] + promoted[removed + 1:]))
+    return {canonical(child) for child in found if child != 'KvK'}
+
+
+def describe(value, white_to_move):
+    """Human readable verdict for a table value"""
+    if value == DRAW:
+        return "Draw"
+    mover, other = ("White", "Black") if white_to_move else ("Black", "White")
+    if value < LOSS:
+        return f"{mover} wins, mate in {value}"
+    if value == LOSS:
+        return f"Checkmate, {other} wins"
+    return f"{other} wins, mate in {value - LOSS}"
+
+
+class Tablebases:
+    """Probe the tables of a directory. Missing tables just make probes return None"""
+
+    def __init__(self, directory=DIRECTORY):
+        self.directory = directory
+        self._tables = {}  # Signature -> mmap, or None when the file is missing
+        self.max_pieces = 2
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.tb'):
+                    self.max_pieces = max(self.max_pieces, len(name) - 4)
+        self.probes = 0
+        self.hits = 0
+
+    def close(self):
+        for table in self._tables.values():
+            if table is not None:
+                table.close()
+        self._tables.clear()
+
+    def _table(self, material):
+        if material not in self._tables:
+            path = os.path.join(self.directory, material + '.tb')
+            table = None
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    if os.fstat(file.fileno()).st_size != table_size(material):
+                        raise ValueError(f"{path} has the wrong size for {material}")
+                    table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._tables[material] = table
+        return self._tables[material]
+
+    def has_table(self, material):
+        return material == 'KvK' or self._table(canonical(material)) is not None
+
+    def probe_pieces(self, placement, white_to_move):
+        """Value for a list of (piece, square) pairs, or None if there is no table for that material"""
+        material = signature(piece for piece, _ in placement)
+        if material == 'KvK':
+            return DRAW
+        stored = canonical(material)
+        table = self._table(stored)
+        if table is None:
+            return None
+        if stored != material:
+            # Mirror the board top to bottom and swap the colours
+            placement = [(('b' if piece[0] == 'w' else 'w') + piece[1], square ^ 56) for piece, square in placement]
+            white_to_move = not white_to_move
+        # Each piece takes the first free slot of its kind, so equal pieces in any order land on valid entries
+        slots = piece_list(stored)
+        squares = [None] * len(slots)
+        for piece, square in placement:
+            slot = next(slot for slot, name in enumerate(slots) if name == piece and squares[slot] is None)
+            squares[slot] = square
+        return table[index(squares, white_to_move)]
+
+    def probe(self, state):
+        """Value of a GameState, or None if it has too many pieces, no table, castling rights or en passant"""
+        if state.piece_count > self.max_pieces:
+            return None
+        pieces = [piece for piece, count in state.pieces_left.items() for _ in range(count)]
+        if not self.has_table(signature(pieces)):
+            return None
+        board = state.board_state
+        if castling_rights(state.has_moved) and any(
+                board[row][4] == color + 'K' and board[row][col] == color + 'R'
+                for color, row in (('w', 7), ('b', 0)) for col in (0, 7)
+                if not state.has_moved[(row, 4)] and not state.has_moved[(row, col)]):
+            return None
+        if en_passant_file(board, state.last_move) is not None:
+            return None
+        self.probes += 1
+        placement = [(board[row][col], row * 8 + col) for row in range(8) for col in range(8)
+                     if board[row][col] != '--']
+        value = self.probe_pieces(placement, state.white_to_move)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def best_move(self, state):
+        """(move, value) of the fastest win, or the slowest loss, by probing every reply. None if any reply can't be probed"""
+        if self.probe(state) is None:
+            return None
+        best = None
+        for move in state.generate_legal_moves():
+            undo = state.push_move(*move)
+            value = self.probe(state)
+            state.pop_move(undo)
+            if value is None or value == INVALID:
+                return None
+            # Our value after the move, as a sort key: fast wins first, then draws, then slow losses
+            if value == DRAW:
+                ours, rank = DRAW, (1, 0)
+            elif value >= LOSS:
+                ours, rank = value - LOSS + 1, (0, value - LOSS)
+            else:
+                ours, rank = LOSS + value, (2, -value)
+            if best is None or rank < best[0]:
+                best = (rank, move, ours)
+        return None if best is None else (best[1], best[2])
+
+
+def generate(material, directory=DIRECTORY, log=print):
+    """Write the table for a material signature, first generating the tables it depends on.
+
+    Returns the path of the table. Existing tables are kept.
+    """
+    material = canonical(material)
+    path = os.path.join(directory, material + '.tb')
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    for child in sorted(_successors(material)):
+        generate(child, directory, log)
+
+    start = time.perf_counter()
+    tables = Tablebases(directory)
+    pieces = piece_list(material)
+    count = len(pieces)
+    colors = [piece[0] for piece in pieces]
+    kinds = [piece[1] for piece in pieces]
+    kings = {color: pieces.index(color + 'K') for color in 'wb'}
+    half = 64 ** count
+    size = 2 * half
+
+    # Work arrays: result in plies (odd for wins, even for losses) until the final encoding
+    unknown, impossible = 255, 254
+    plies = bytearray([unknown]) * size
+    remaining = bytearray(size)  # Moves within this table not yet known to lose
+    exit_loss = bytearray(size)  # Longest loss through a capture or promotion, 255 if one of them saves the game
+    buckets = [array('L') for _ in range(256)]  # Positions to settle at each ply, as compact arrays
+
+    def attacked(target, by_color, squares, occupied):
+        return any(colors[piece] == by_color and squares[piece] is not None
+                   and _attacks(kinds[piece], by_color, squares[piece], target, occupied)
+                   for piece in range(count))
+
+    for position in range(size):
+        white_to_move = position < half
+        squares = [(position >> (6 * piece)) & 63 for piece in range(count)]
+        occupied = set(squares)
+        side, other = ('w', 'b') if white_to_move else ('b', 'w')
+        if len(occupied) < count or any(kinds[piece] == 'P' and squares[piece] >> 3 in (0, 7)
+                                        for piece in range(count)) \
+                or attacked(squares[kings[other]], side, squares, occupied):
+            plies[position] = impossible
+            continue
+
+        internal = 0
+        best_win = unknown
+        longest_loss = 0
+        legal = 0
+        by_square = {square: piece for piece, square in enumerate(squares)}
+        for piece in range(count):
+            if colors[piece] != side:
+                continue
+            kind = kinds[piece]
+            square = squares[piece]
+            targets = []
+            if kind == 'K':
+                targets = KING[square]
+            elif kind == 'N':
+                targets = KNIGHT[square]
+            elif kind == 'P':
+                step = -8 if side == 'w' else 8
+                if square + step not in occupied:
+                    targets = [square + step]
+                    if square >> 3 == (6 if side == 'w' else 1) and square + 2 * step not in occupied:
+                        targets.append(square + 2 * step)
+                targets = targets + [target for target in PAWN_ATTACKS[side][square] if target in by_square]
+            else:
+                for ray in RAYS[kind][square]:
+                    for target in ray:
+                        targets.append(target)
+                        if target in occupied:
+                            break
+
+            for target in targets:
+                captured = by_square.get(target)
+                if captured is not None and colors[captured] == side:
+                    continue
+                after = list(squares)
+                after[piece] = target
+                if captured is not None:
+                    after[captured] = None
+                king_square = target if kind == 'K' else squares[kings[side]]
+                occupied_after = set(after) - {None}
+                if attacked(king_square, other, after, occupied_after):
+                    continue
+                legal += 1
+                promotes = kind == 'P' and target >> 3 in (0, 7)
+                if captured is None and not promotes:
+                    internal += 1
+                    continue
+                # Leaves this table: look the result up in the smaller one
+                for promotion in ('Q', 'R', 'B', 'N') if promotes else (None,):
+                    placement = [(side + promotion if moved == piece and promotion else pieces[moved], square)
+                                 for moved, square in enumerate(after) if square is not None]
+                    value = tables.probe_pieces(placement, not white_to_move)
+                    if value == DRAW:
+                        longest_loss = unknown
+                    elif value >= LOSS:
+                        best_win = min(best_win, 2 * (value - LOSS) + 1)
+                        longest_loss = unknown
+                    elif longest_loss != unknown:
+                        longest_loss = max(longest_loss, 2 * value)
+
+        if not legal:
+            if attacked(squares[kings[side]], other, squares, occupied):
+                buckets[0].append(position)  # Checkmate
+            continue  # Stalemate stays a draw
+        remaining[position] = internal
+        exit_loss[position] = longest_loss
+        if best_win < unknown:
+            buckets[best_win].append(position)
+        elif not internal and longest_loss != unknown:
+            buckets[longest_loss].append(position)
+
+    log(f"{material}: positions set up in {time.perf_counter() - start:.1f}s")
+
+    # Retrograde pass: settle positions in order of distance to mate, walking back along moves within the table
+    for ply in range(254):
+        for position in buckets[ply]:
+            if plies[position] != unknown:
+                continue
+            plies[position] = ply
+            white_to_move = position < half
+            mover = 'b' if white_to_move else 'w'  # Side that made the last move
+            squares = [(position >> (6 * piece)) & 63 for piece in range(count)]
+            occupied = set(squares)
+            base = position ^ half if white_to_move else position - half
+            for piece in range(count):
+                if colors[piece] != mover:
+                    continue
+                kind = kinds[piece]
+                square = squares[piece]
+                if kind == 'K':
+                    origins = [origin for origin in KING[square] if origin not in occupied]
+                elif kind == 'N':
+                    origins = [origin for origin in KNIGHT[square] if origin not in occupied]
+                elif kind == 'P':
+                    step = 8 if mover == 'w' else -8  # Backwards
+                    origins = []
+                    origin = square + step
+                    if origin not in occupied and origin >> 3 not in (0, 7):
+                        origins.append(origin)
+                        if square >> 3 == (4 if mover == 'w' else 3) and origin + step not in occupied:
+                            origins.append(origin + step)
+                else:
+                    origins = []
+                    for ray in RAYS[kind][square]:
+                        for origin in ray:
+                            if origin in occupied:
+                                break
+                            origins.append(origin)
+                shift = 6 * piece
+                cleared = base - (square << shift)
+                for origin in origins:
+                    previous = cleared + (origin << shift)
+                    if plies[previous] != unknown:
+                        continue
+                    if ply % 2 == 0:
+                        # This position is lost for the side to move, so moving into it wins
+                        if ply + 1 < 254:
+                            buckets[ply + 1].append(previous)
+                    else:
+                        remaining[previous] -= 1
+                        if not remaining[previous] and exit_loss[previous] != unknown:
+                            buckets[max(ply + 1, exit_loss[previous])].append(previous)
+        buckets[ply] = None
+
+    table = bytearray(size)
+    for position in range(size):
+        ply = plies[position]
+        if ply == impossible:
+            table[position] = INVALID
+        elif ply != unknown:
+            table[position] = (ply + 1) // 2 if ply % 2 else LOSS + ply // 2
+    tables.close()
+
+    partial = path + '.part'
+    with open(partial, 'wb') as out:
+        out.write(table)
+    os.replace(partial, path)
+    log(f"{material}: written to {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    parser.add_argument('--dir', default=DIRECTORY, help="directory holding the tables")
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help="build tables, with the smaller ones they need")
+    generate_parser.add_argument('material', nargs='+', help="signatures such as KQvK or KRvKB")
+    probe_parser = commands.add_parser('probe', help="look up a position and its best move")
+    probe_parser.add_argument('fen')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for material in args.material:
+            generate(material, args.dir)
+        return 0
+
+    state = GameState.from_fen(args.fen)
+    tables = Tablebases(args.dir)
+    value = tables.probe(state)
+    if value is None:
+        print("Position not covered by the tables")
+        return 1
+    print(describe(value, state.white_to_move))
+    best = tables.best_move(state)
+    if best is not None:
+        from pgn import move_san
+        print(f"Best move {move_san(state, best[0])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
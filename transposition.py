@@ -0,0 +1,102 @@
+"""Fixed-size transposition table for the search, keyed by GameState.zobrist_key.
+
+Entries live in two flat arrays of unsigned 64-bit integers (keys and
+packed data), so memory is set up front and stays the same however long
+the search runs. Each bucket holds two slots: the first keeps the deepest
+result of the current search, the second is always replaced.
+"""
+
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3  # Bound types
+
+ENTRY_BYTES = 16  # 8 for the key, 8 for the packed data
+_PROMOTIONS = [None, 'Q', 'R', 'B', 'N']
+_SCORE_OFFSET = 1 << 21
+
+
+def encode_move(move):
+    """Pack a (start_row, start_col, end_row, end_col, promotion) move into 16 bits, 0 for no move"""
+    if move is None:
+        return 0
+    start_row, start_col, end_row, end_col, promotion = move
+    return ((start_row * 8 + start_col) | (end_row * 8 + end_col) << 6
+            | _PROMOTIONS.index(promotion) << 12 | 1 << 15)
+
+
+def decode_move(code):
+    if not code:
+        return None
+    start, end = code & 63, code >> 6 & 63
+    return (start >> 3, start & 7, end >> 3, end & 7, _PROMOTIONS[code >> 12 & 7])
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_BYTES))
+        self.keys = array('Q', bytes(8 * 2 * self.buckets))
+        self.data = array('Q', bytes(8 * 2 * self.buckets))
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * 2 * self.buckets))
+        self.data = array('Q', bytes(8 * 2 * self.buckets))
+        self.generation = 0
+        self.probes = self.hits = self.stores = 0
+
+    def new_search(self):
+        """Age existing entries so deep results from old searches can be replaced"""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def probe(self, key):
+        """Return (depth, score, bound, move) stored for a position, or None"""
+        self.probes += 1
+        index = (key % self.buckets) * 2
+        keys = self.keys
+        if keys[index] == key:
+            data = self.data[index]
+        elif keys[index + 1] == key:
+            data = self.data[index + 1]
+        else:
+            return None
+        self.hits += 1
+        return (data >> 18 & 0xFF, (data >> 26 & 0x3FFFFF) - _SCORE_OFFSET, data >> 16 & 3,
+                decode_move(data & 0xFFFF))
+
+    def store(self, key, depth, score, bound, move):
+        self.stores += 1
+        index = (key % self.buckets) * 2
+        keys = self.keys
+        data = self.data
+        packed = (encode_move(move) | bound << 16 | min(depth, 255) << 18
+                  | (score + _SCORE_OFFSET) << 26 | self.generation << 48)
+
+        # Depth-preferred slot: same position, at least as deep, or left over from an older search
+        old = data[index]
+        if keys[index] == key or depth >= (old >> 18 & 0xFF) or (old >> 48) != self.generation:
+            if keys[index] != key and keys[index]:
+                # Keep the displaced entry in the always-replace slot
+                keys[index + 1] = keys[index]
+                data[index + 1] = old
+            keys[index] = key
+            data[index] = packed
+        else:
+            keys[index + 1] = key
+            data[index + 1] = packed
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def fill_rate(self, sample=1000):
+        """Share of slots in use, estimated from the first buckets like a UCI hashfull"""
+        slots = min(sample, self.buckets) * 2
+        used = sum(1 for index in range(slots) if self.keys[index])
+        return used / slots
+
+    def stats(self):
+        return (f"TT {self.size_mb}MB  {self.buckets * 2} slots  probes {self.probes}  "
+                f"hit rate {self.hit_rate():.1%}  fill {self.fill_rate():.1%}")
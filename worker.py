@@ -0,0 +1,64 @@
+"""Run a search on a background thread so the pygame loop keeps drawing and handling input"""
+
+import threading
+from copy import deepcopy
+
+
+class SearchHandle:
+    """A cancellable search over a snapshot of a GameState.
+
+    Poll done() from the event loop and read result once it is set.
+    progress holds the latest (depth, score, best_move, nodes) reported by
+    the searcher; on_progress, if given, is called with the same values
+    from the worker thread.
+    """
+
+    def __init__(self, searcher, state, on_progress=None):
+        self.searcher = searcher
+        # The search plays moves in place, so it works on its own copy of the game
+        self._state = deepcopy(state)
+        self.on_progress = on_progress
+        self.progress = None
+        self.result = None
+        self.aborted = False
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        # A stop asked of an earlier search that had already finished must not cut this one short
+        self.searcher.stop_requested = False
+        self._thread.start()
+        return self
+
+    def _run(self):
+        self.searcher.on_iteration = self._report
+        try:
+            self.result = self.searcher.search(self._state)
+        finally:
+            self.searcher.on_iteration = None
+            self._done.set()
+
+    def _report(self, depth, score, move, nodes):
+        self.progress = (depth, score, move, nodes)
+        if self.on_progress is not None:
+            self.on_progress(depth, score, move, nodes)
+
+    def done(self):
+        """Check if the search has finished, without blocking"""
+        return self._done.is_set()
+
+    def move_now(self):
+        """Finish early and report the best move found so far"""
+        if not self.done():
+            self.searcher.stop()
+
+    def abort(self):
+        """Stop the search and discard its result"""
+        self.aborted = True
+        if not self.done():
+            self.searcher.stop()
+
+    def wait(self, timeout=None):
+        """Block until the search has finished. Returns the best move, or None if aborted"""
+        self._done.wait(timeout)
+        return None if self.aborted else self.result
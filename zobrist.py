@@ -0,0 +1,62 @@
+"""Zobrist keys: a 64-bit position identity that is updated with a few XORs per move.
+
+The key covers piece placement, side to move, castling rights (derived
+from GameState.has_moved) and the en passant file when a capture is
+actually possible, so equal keys mean the same position for repetition
+purposes.
+"""
+
+import random
+
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = {
+    color + kind: [_rng.getrandbits(64) for _ in range(64)]
+    for color in 'wb' for kind in 'PRNBQK'
+}
+SIDE_KEY = _rng.getrandbits(64)  # XORed in when black is to move
+CASTLING_KEYS = [_rng.getrandbits(64) for _ in range(16)]
+EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+
+# has_moved squares that must be unmoved for each castling right, bit order K, Q, k, q
+_RIGHTS = [((7, 4), (7, 7)), ((7, 4), (7, 0)), ((0, 4), (0, 7)), ((0, 4), (0, 0))]
+
+
+def castling_rights(has_moved):
+    """Castling rights as a 4-bit mask: white kingside, white queenside, black kingside, black queenside"""
+    rights = 0
+    for bit, (king, rook) in enumerate(_RIGHTS):
+        if not has_moved[king] and not has_moved[rook]:
+            rights |= 1 << bit
+    return rights
+
+
+def en_passant_file(board, last_move):
+    """File of the en passant target if a pawn can capture onto it, otherwise None"""
+    if last_move is None:
+        return None
+    row, col = last_move[2], last_move[3]
+    capturer = 'bP' if board[row][col] == 'wP' else 'wP'
+    if (col > 0 and board[row][col - 1] == capturer) or (col < 7 and board[row][col + 1] == capturer):
+        return col
+    return None
+
+
+def en_passant_key(board, last_move):
+    col = en_passant_file(board, last_move)
+    return 0 if col is None else EN_PASSANT_KEYS[col]
+
+
+def compute_key(state):
+    """Hash a GameState from scratch. Used when a position is set up and to check the incremental key"""
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = state.board_state[row][col]
+            if piece != '--':
+                key ^= PIECE_KEYS[piece][row * 8 + col]
+    if not state.white_to_move:
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[castling_rights(state.has_moved)]
+    key ^= en_passant_key(state.board_state, state.last_move)
+    return key